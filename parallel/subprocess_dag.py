@@ -0,0 +1,323 @@
+from collections import deque
+import os
+import selectors
+import signal
+import subprocess
+import time
+
+
+# how often a command whose pipes are closed is checked for having exited
+REAP_INTERVAL = 0.01
+
+
+class Command:
+    """
+    A command of the DAG: argv list, or a string run through the shell.
+    
+    deps are indices of the commands that must succeed before this one starts.
+    timeout is in seconds, counted from its start; None falls back to the
+    timeout given to run_dag.
+    """
+    def __init__(self, cmd, deps=(), timeout=None, name=None):
+        self.cmd = cmd
+        self.deps = list(deps)
+        self.timeout = timeout
+        self.shell = isinstance(cmd, str)
+        self.name = name or (cmd if self.shell else ' '.join(cmd))
+    
+    def __repr__(self):
+        return f'Command({self.name!r})'
+
+
+class CommandResult:
+    """
+    What happened to one command.
+    
+    status is 'ok', 'failed' (non-zero exit), 'timeout', 'error' (could not
+    start) or 'skipped' (a dependency did not succeed). stdout and stderr hold
+    the lines without their newline, unless run_dag was told not to keep them.
+    """
+    def __init__(self, index, command):
+        self.index = index
+        self.command = command
+        self.status = None
+        self.returncode = None
+        self.stdout = []
+        self.stderr = []
+        self.started = None
+        self.finished = None
+    
+    @property
+    def ok(self):
+        return self.status == 'ok'
+    
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+    
+    def __repr__(self):
+        return f'CommandResult({self.command.name!r}, status={self.status!r}, returncode={self.returncode})'
+
+
+class _Running:
+    """A started process and the partial lines read from its pipes so far."""
+    def __init__(self, result, process, deadline):
+        self.result = result
+        self.process = process
+        self.deadline = deadline
+        self.partial = {'stdout': b'', 'stderr': b''}
+        self.open_pipes = 2
+
+
+def as_command(command):
+    """Accepts a Command, or a [cmd, deps] pair like the original script's list."""
+    if isinstance(command, Command):
+        return command
+    cmd, deps = command
+    return Command(cmd, deps)
+
+
+def run_dag(commands, max_processes=None, timeout=None, keep_output=True):
+    """
+    Runs shell commands in parallel, each one as soon as its dependencies succeeded.
+    
+    A generator of events, in the order they happen:
+    - (index, 'stdout', line) and (index, 'stderr', line) for every line a command prints
+    - (index, 'exit', CommandResult) once a command is done or skipped
+    
+    At most max_processes (default: cpu count) commands run at once. All pipes
+    are read from this one thread through a selector on non-blocking file
+    descriptors, so output streams line by line however many commands run and
+    memory is bounded by keep_output=False. Scheduling keeps an indegree per
+    command and the list of its dependents, so every completion costs
+    O(dependents) whatever the size of the DAG.
+    
+    A command running past its timeout is killed along with its process group.
+    Commands depending on a command that did not succeed are skipped. A
+    command that closed or redirected its output keeps running unseen by the
+    selector: it is polled every REAP_INTERVAL seconds until it exits.
+    """
+    commands = [as_command(command) for command in commands]
+    max_processes = max_processes or os.cpu_count() or 1
+    results = [CommandResult(i, command) for i, command in enumerate(commands)]
+    dependents = [[] for _ in commands]
+    indegree = [0] * len(commands)
+    for i, command in enumerate(commands):
+        for dep in dict.fromkeys(command.deps):
+            if not 0 <= dep < len(commands) or dep == i:
+                raise ValueError(f'{command!r} depends on {dep}, which is not another command of the DAG')
+            dependents[dep].append(i)
+            indegree[i] += 1
+    ready = deque(i for i, n in enumerate(indegree) if n == 0)
+    selector = selectors.DefaultSelector()
+    running = {} # pid -> _Running
+    finished = 0
+    
+    def start(i):
+        result = results[i]
+        command = commands[i]
+        result.started = time.time()
+        try:
+            process = subprocess.Popen(
+                command.cmd, shell=command.shell, stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                start_new_session=True, # own process group, so a timeout kills the shell's children too
+            )
+        except OSError as error:
+            result.status = 'error'
+            result.stderr.append(str(error))
+            result.finished = time.time()
+            return False
+        limit = command.timeout if command.timeout is not None else timeout
+        proc = running[process.pid] = _Running(result, process, result.started + limit if limit else None)
+        for stream, pipe in (('stdout', process.stdout), ('stderr', process.stderr)):
+            os.set_blocking(pipe.fileno(), False)
+            selector.register(pipe, selectors.EVENT_READ, (proc, stream))
+        return True
+    
+    def finish(result):
+        """Settles a command and releases or skips its dependents. Returns the events to yield."""
+        nonlocal finished
+        events = []
+        settled = [result]
+        while settled:
+            result = settled.pop()
+            finished += 1
+            events.append((result.index, 'exit', result))
+            for j in dependents[result.index]:
+                if result.ok:
+                    indegree[j] -= 1
+                    if indegree[j] == 0:
+                        ready.append(j)
+                elif results[j].status is None: # skip it, and everything downstream of it
+                    results[j].status = 'skipped'
+                    settled.append(results[j])
+        return events
+    
+    def reap(proc):
+        """Settles a command whose pipes are closed, if it has exited. Returns the events to yield."""
+        returncode = proc.process.poll()
+        if returncode is None:
+            return []
+        del running[proc.process.pid]
+        result = proc.result
+        result.returncode = returncode
+        result.finished = time.time()
+        if result.status is None:
+            result.status = 'ok' if returncode == 0 else 'failed'
+        return finish(result)
+    
+    def emit(proc, stream, data):
+        """Splits data into complete lines, keeping the unterminated tail for the next read."""
+        *lines, proc.partial[stream] = (proc.partial[stream] + data).split(b'\n')
+        for line in lines:
+            line = line.decode(errors='replace')
+            if keep_output:
+                getattr(proc.result, stream).append(line)
+            yield proc.result.index, stream, line
+    
+    try:
+        while finished < len(commands):
+            while ready and len(running) < max_processes:
+                i = ready.popleft()
+                if not start(i):
+                    yield from finish(results[i])
+            if not running:
+                if not ready and finished < len(commands):
+                    stuck = [commands[i] for i, result in enumerate(results) if result.status is None]
+                    raise ValueError(f'circular dependencies between {stuck}')
+                continue
+            
+            deadlines = [proc.deadline for proc in running.values() if proc.deadline is not None]
+            wait = max(0, min(deadlines) - time.time()) if deadlines else None
+            if any(proc.open_pipes == 0 for proc in running.values()):
+                wait = REAP_INTERVAL if wait is None else min(wait, REAP_INTERVAL)
+            for key, _ in selector.select(wait):
+                proc, stream = key.data
+                data = os.read(key.fd, 1 << 16)
+                if data:
+                    yield from emit(proc, stream, data)
+                    continue
+                # EOF: flush a last line without newline, the process is reaped below
+                if proc.partial[stream]:
+                    yield from emit(proc, stream, b'\n')
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                proc.open_pipes -= 1
+            
+            # never wait() here: a command may outlive its pipes, and would stall every other one
+            for proc in [proc for proc in running.values() if proc.open_pipes == 0]:
+                yield from reap(proc)
+            
+            now = time.time()
+            for proc in running.values():
+                if proc.deadline is not None and now >= proc.deadline and proc.result.status is None:
+                    proc.result.status = 'timeout'
+                    proc.deadline = None
+                    try:
+                        os.killpg(proc.process.pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+    finally: # the consumer stopped early or something failed: leave nothing behind
+        for proc in running.values():
+            try:
+                os.killpg(proc.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            proc.process.wait()
+            for pipe in (proc.process.stdout, proc.process.stderr):
+                pipe.close()
+        selector.close()
+
+
+def run_commands(commands, max_processes=None, timeout=None, on_line=None):
+    """
+    Runs the DAG to the end and returns a CommandResult per command, in input order.
+    
+    on_line(index, stream, line) is called for every line as it is printed.
+    """
+    results = [None] * len(commands)
+    for index, kind, value in run_dag(commands, max_processes, timeout, keep_output=True):
+        if kind == 'exit':
+            results[index] = value
+        elif on_line:
+            on_line(index, kind, value)
+    return results
+
+
+
+
+
+
+
+
+
+
+##### TESTS #####
+
+
+import unittest
+
+
+class TestRunDag(unittest.TestCase):
+    
+    def test_dependencies_and_output(self):
+        results = run_commands([
+            Command('echo a'),
+            Command(['sh', '-c', 'echo b; echo err >&2'], deps=[0]),
+            Command('printf "no newline"', deps=[0, 1]),
+        ])
+        
+        self.assertEqual([result.status for result in results], ['ok', 'ok', 'ok'])
+        self.assertEqual(results[1].stdout, ['b'])
+        self.assertEqual(results[1].stderr, ['err'])
+        self.assertEqual(results[2].stdout, ['no newline'])
+        self.assertLessEqual(results[0].finished, results[1].started)
+    
+    def test_failure_skips_dependents(self):
+        results = run_commands([
+            Command('exit 3'),
+            Command('echo never', deps=[0]),
+            Command('echo never either', deps=[1]),
+            Command('echo independent'),
+        ])
+        
+        self.assertEqual([result.status for result in results], ['failed', 'skipped', 'skipped', 'ok'])
+        self.assertEqual(results[0].returncode, 3)
+    
+    def test_timeout(self):
+        started = time.time()
+        results = run_commands([Command('sleep 5', timeout=0.2)])
+        
+        self.assertEqual(results[0].status, 'timeout')
+        self.assertLess(time.time() - started, 2)
+    
+    def test_command_without_output_pipes(self):
+        # closes its pipes right away: it must not stall the others, and still time out
+        lines = []
+        started = time.time()
+        results = run_commands(
+            [
+                Command('exec >/dev/null 2>&1; sleep 5', timeout=0.5),
+                Command('exec >/dev/null 2>&1; sleep 2'),
+                Command('for i in 1 2 3; do echo $i; sleep 0.1; done'),
+            ],
+            max_processes=3,
+            on_line=lambda index, stream, line: lines.append((time.time() - started, line)),
+        )
+        
+        self.assertEqual([result.status for result in results], ['timeout', 'ok', 'ok'])
+        self.assertLess(results[0].duration, 1.5)
+        self.assertLess(results[2].duration, 1)
+        self.assertEqual([line for _, line in lines], ['1', '2', '3'])
+        self.assertLess(lines[-1][0], 1)
+    
+    def test_circular_dependencies(self):
+        with self.assertRaises(ValueError):
+            run_commands([Command('true', deps=[1]), Command('true', deps=[0])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,28 +1,297 @@
 # inspired from https://github.com/ParthS007/background
 import multiprocessing # can be used to get cpu count later
 import concurrent.futures
+from collections import deque
+from functools import partial, wraps
+import asyncio
+import atexit
+import heapq
+import importlib
+import inspect
+import itertools
+import sys
+import threading
+import time
+
+
+class ElasticPool:
+    """
+    Thread pool that grows with its queue and shrinks when idle.
+
+    Jobs with a higher priority run first, jobs of equal priority in the order
+    they were submitted. A worker is started whenever a job is queued and no worker is free, up to
+    max_workers; a worker that waited idle_timeout seconds without a job exits,
+    down to min_workers. The latencies (queued to finished) of the last
+    latency_window jobs are kept for stats().
+    """
+    def __init__(self, max_workers=10, min_workers=0, idle_timeout=60.0, latency_window=1024):
+        self.max_workers = max_workers
+        self.min_workers = min_workers
+        self.idle_timeout = idle_timeout
+        self.queue = [] # heap of (-priority, sequence, future, fn, args, kwargs, queued_at)
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.workers = 0
+        self.idle = 0
+        self.submitted = 0
+        self.completed = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.closed = False
+        atexit.register(self.shutdown) # workers are daemons: let queued jobs finish first
+
+    def submit(self, fn, *args, **kwargs):
+        return self.push(0, fn, args, kwargs)
+
+    def push(self, priority, fn, args=(), kwargs=None):
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError('cannot submit to a pool that was shut down')
+            heapq.heappush(self.queue, (-priority, next(self.sequence), future, fn, args, kwargs or {}, time.perf_counter()))
+            self.submitted += 1
+            if self.idle >= len(self.queue):
+                self.not_empty.notify()
+            elif self.workers < self.max_workers:
+                self.workers += 1
+                threading.Thread(target=self._work, daemon=True).start()
+        return future
+
+    def _work(self):
+        while True:
+            with self.lock:
+                self.idle += 1
+                while not self.queue and not self.closed:
+                    if not self.not_empty.wait(self.idle_timeout) and not self.queue and self.workers > self.min_workers:
+                        break # idle for too long
+                self.idle -= 1
+                if not self.queue:
+                    self.workers -= 1
+                    return
+                _, _, future, fn, args, kwargs, queued_at = heapq.heappop(self.queue)
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as error:
+                    future.set_exception(error)
+            with self.lock:
+                self.completed += 1
+                self.latencies.append(time.perf_counter() - queued_at)
+
+    def stats(self):
+        """Queue length, worker counts, job counts and latency percentiles (seconds) of the recent jobs."""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                'queued': len(self.queue),
+                'workers': self.workers,
+                'active': self.workers - self.idle,
+                'idle': self.idle,
+                'submitted': self.submitted,
+                'completed': self.completed,
+            }
+        for q in (50, 90, 99):
+            stats[f'p{q}'] = latencies[min(len(latencies) - 1, len(latencies) * q // 100)] if latencies else None
+        return stats
+
+    def shutdown(self, wait=True):
+        """Stops taking jobs; workers exit once the queue is drained."""
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify_all()
+        if wait:
+            while True:
+                with self.lock:
+                    if not self.workers:
+                        return
+                time.sleep(0.01)
+
+
+class AsyncioBackend:
+    """An event loop on its own thread, running the coroutine functions sent to it concurrently."""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.running = set() # futures of the coroutines not done yet
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        atexit.register(self.shutdown)
+
+    def submit(self, fn, *args, **kwargs):
+        future = asyncio.run_coroutine_threadsafe(fn(*args, **kwargs), self.loop)
+        self.running.add(future)
+        future.add_done_callback(self.running.discard)
+        return future
+
+    def shutdown(self, wait=True):
+        if wait:
+            concurrent.futures.wait(list(self.running))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def call_unwrapped(module, qualname, args, kwargs):
+    """
+    Runs in a worker process: finds a @background.task by name and calls the
+    function it decorates. The function itself cannot be pickled, its name in
+    the module now refers to the decorator's wrapper.
+    """
+    target = sys.modules.get(module) or importlib.import_module(module)
+    for part in qualname.split('.'):
+        target = getattr(target, part)
+    return target.__wrapped__(*args, **kwargs)
+
 
 class Background:
-    def __init__(self, n=10):
-        self.n = n
-        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=n)
+    """
+    Runs functions in the background on one of three backends:
+    - 'thread': an ElasticPool of up to n threads, for I/O-bound work
+    - 'process': a process pool of `processes` workers (default: cpu count),
+      for CPU-bound work; functions and arguments must be picklable and
+      decorated tasks defined at module level
+    - 'asyncio': an event loop on its own thread, for coroutine functions
+
+    backend is the default for plain functions; coroutine functions always go
+    to the asyncio backend. Only the thread backend orders its queue by
+    priority, the others start jobs in submission order.
+    """
+    BACKENDS = ('thread', 'process', 'asyncio')
+
+    def __init__(self, n=10, min_workers=0, idle_timeout=60.0, keep_results=1000, backend='thread', processes=None):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"unknown backend {backend!r}, expected one of {self.BACKENDS}")
+        self.backend = backend
+        self.pool = ElasticPool(max_workers=n, min_workers=min_workers, idle_timeout=idle_timeout)
+        self.n_processes = processes or multiprocessing.cpu_count()
+        self._processes = None # created on first use
+        self._loop = None
+        self.in_process = set() # futures of the process jobs not done yet
         self.callbacks = []
-        self.results = []
+        self.results = deque(maxlen=keep_results) # the most recent futures only, so long-lived apps don't leak
+        self.pending = {} # dedup key -> future of the job queued or running under it
+        self.lock = threading.Lock()
+
+    @property
+    def n(self):
+        return self.pool.max_workers
+
+    @n.setter
+    def n(self, value): # takes effect on the next submit
+        self.pool.max_workers = value
+
+    @property
+    def processes(self):
+        if self._processes is None:
+            self._processes = concurrent.futures.ProcessPoolExecutor(max_workers=self.n_processes)
+        return self._processes
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            self._loop = AsyncioBackend()
+        return self._loop
+
+    def backend_for(self, f, backend=None):
+        if inspect.iscoroutinefunction(f):
+            return 'asyncio'
+        backend = backend or self.backend
+        if backend not in self.BACKENDS:
+            raise ValueError(f"unknown backend {backend!r}, expected one of {self.BACKENDS}")
+        return backend
 
     def run(self, f, *args, **kwargs):
-        self.pool._max_workers = self.n
-        self.pool._adjust_thread_count()
-        future = self.pool.submit(f, *args, **kwargs)
+        return self.submit(f, args, kwargs)
+
+    def submit(self, f, args=(), kwargs=None, priority=0, key=None, backend=None):
+        """
+        Queues f(*args, **kwargs) at the given priority, higher runs first.
+
+        If a job submitted with the same key is still queued or running, its
+        future is returned instead and nothing new is scheduled; the future's
+        coalesced attribute counts how many submissions it absorbed.
+        """
+        return self._submit(f, args, kwargs, priority, key, backend)[0]
+    
+    def _submit(self, f, args, kwargs, priority, key, backend):
+        """submit(), also telling whether a new job was scheduled (True) or the call was coalesced (False)."""
+        backend = self.backend_for(f, backend)
+        if key is None:
+            return self._push(f, args, kwargs, priority, backend), True
+        with self.lock:
+            future = self.pending.get(key)
+            if future is not None:
+                future.coalesced += 1
+                return future, False
+            future = self.pending[key] = self._push(f, args, kwargs, priority, backend)
+        future.add_done_callback(partial(self._forget, key))
+        return future, True
+
+    def _push(self, f, args, kwargs, priority, backend):
+        kwargs = kwargs or {}
+        if backend == 'process':
+            if getattr(f, 'background', None) is self: # a @background.task, ship its name instead
+                future = self.processes.submit(call_unwrapped, f.__module__, f.__qualname__, args, kwargs)
+            else:
+                future = self.processes.submit(f, *args, **kwargs)
+            self.in_process.add(future)
+            future.add_done_callback(self.in_process.discard)
+        elif backend == 'asyncio':
+            future = self.loop.submit(f, *args, **kwargs)
+        else:
+            future = self.pool.push(priority, f, args, kwargs)
         future.source_function = f.__name__
+        future.coalesced = 0
         self.results.append(future)
         return future
 
-    def task(self, f):
+    def _forget(self, key, future):
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    def stats(self):
+        """Thread pool stats, plus the number of process and asyncio jobs not done yet."""
+        stats = self.pool.stats()
+        stats['process_jobs'] = len(self.in_process)
+        stats['asyncio_jobs'] = len(self._loop.running) if self._loop else 0
+        return stats
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait)
+        if self._loop is not None:
+            self._loop.shutdown(wait=wait)
+
+    def task(self, f=None, *, priority=0, key=None, backend=None):
+        """
+        @background.task, or @background.task(priority=..., key=..., backend=...).
+
+        key turns on deduplication: True keys a call on its arguments (which
+        must be hashable), a function is called with the call's arguments and
+        returns the key.
+
+        With the process backend the worker looks the task up by module and
+        name, so define it at the top level of an importable module. With the
+        spawn start method (the default on macOS and Windows) the worker
+        imports the module afresh: a task defined under
+        `if __name__ == "__main__"` does not exist there. Submit a plain
+        module-level function with background.submit(..., backend='process')
+        when in doubt.
+        """
+        if f is None:
+            return partial(self.task, priority=priority, key=key, backend=backend)
+        @wraps(f)
         def do_task(*args, **kwargs):
-            result = self.run(f, *args, **kwargs)
-            for cb in self.callbacks:
-                result.add_done_callback(cb)
+            if key is True:
+                dedup_key = (f, args, tuple(sorted(kwargs.items())))
+            else:
+                dedup_key = key(*args, **kwargs) if key is not None else None
+            # the process backend gets the wrapper, which pickles by name, see call_unwrapped
+            target = do_task if self.backend_for(f, backend) == 'process' else f
+            result, is_new = self._submit(target, args, kwargs, priority, dedup_key, backend)
+            if is_new: # a coalesced future already has them
+                for cb in self.callbacks:
+                    result.add_done_callback(cb)
             return result
+        do_task.background = self
         return do_task
 
     def callback(self, f):
@@ -32,6 +301,197 @@ class Background:
         return register_callback
 
 
+def crunch(n): # module level, so process workers find it under any start method
+    return sum(i * i for i in range(n))
+
+
+
+
+
+
+
+
+
+
+##### TESTS #####
+# python -m unittest background (running the file shows the example below)
+
+
+import unittest
+
+
+class TestElasticPool(unittest.TestCase):
+    
+    def setUp(self):
+        self.gate = threading.Event()
+        self.addCleanup(self.gate.set)
+    
+    def test_grows_up_to_max_workers(self):
+        pool = ElasticPool(max_workers=3)
+        futures = [pool.submit(self.gate.wait) for _ in range(5)]
+        time.sleep(0.05)
+        
+        stats = pool.stats()
+        self.assertEqual((stats['workers'], stats['active'], stats['queued']), (3, 3, 2))
+        self.gate.set()
+        concurrent.futures.wait(futures, timeout=5)
+        self.assertEqual(pool.stats()['completed'], 5)
+        pool.shutdown()
+    
+    def test_idle_workers_exit(self):
+        pool = ElasticPool(max_workers=4, min_workers=1, idle_timeout=0.05)
+        futures = [pool.submit(time.sleep, 0.05) for _ in range(4)]
+        concurrent.futures.wait(futures, timeout=5)
+        self.assertEqual(pool.stats()['workers'], 4)
+        time.sleep(0.3)
+        
+        self.assertEqual(pool.stats()['workers'], 1)
+        self.assertEqual(pool.submit(lambda: 'still works').result(timeout=5), 'still works')
+        pool.shutdown()
+    
+    def test_priority_order(self):
+        pool = ElasticPool(max_workers=1)
+        order = []
+        pool.submit(self.gate.wait) # holds the only worker while the rest is queued
+        time.sleep(0.05)
+        futures = [pool.push(priority, order.append, (name,)) for priority, name in [(0, 'low'), (5, 'high'), (1, 'mid'), (5, 'high2'), (0, 'low2')]]
+        self.gate.set()
+        concurrent.futures.wait(futures, timeout=5)
+        
+        self.assertEqual(order, ['high', 'high2', 'mid', 'low', 'low2'])
+        pool.shutdown()
+    
+    def test_stats_percentiles(self):
+        pool = ElasticPool(max_workers=2, latency_window=10)
+        self.assertIsNone(pool.stats()['p50'])
+        futures = [pool.submit(time.sleep, 0.01 * (i % 3)) for i in range(20)]
+        concurrent.futures.wait(futures, timeout=5)
+        
+        stats = pool.stats()
+        self.assertEqual((stats['submitted'], stats['completed']), (20, 20))
+        self.assertEqual(len(pool.latencies), 10)
+        self.assertLessEqual(stats['p50'], stats['p90'])
+        self.assertLessEqual(stats['p90'], stats['p99'])
+        self.assertGreaterEqual(stats['p99'], 0.02)
+        pool.shutdown()
+    
+    def test_shutdown_drains_and_refuses(self):
+        pool = ElasticPool(max_workers=1)
+        futures = [pool.submit(time.sleep, 0.01) for _ in range(5)]
+        pool.shutdown()
+        
+        self.assertTrue(all(future.done() for future in futures))
+        with self.assertRaises(RuntimeError):
+            pool.submit(time.sleep, 0)
+
+
+class TestBackground(unittest.TestCase):
+    
+    def setUp(self):
+        self.background = Background(n=4)
+        self.addCleanup(self.background.shutdown)
+        self.gate = threading.Event()
+        self.addCleanup(self.gate.set)
+    
+    def test_results_are_bounded(self):
+        background = Background(n=2, keep_results=3)
+        futures = [background.run(abs, -i) for i in range(10)]
+        concurrent.futures.wait(futures, timeout=5)
+        
+        self.assertEqual([future.result() for future in background.results], [7, 8, 9])
+        background.shutdown()
+    
+    def test_same_key_coalesces(self):
+        first = self.background.submit(self.gate.wait, key='k')
+        again = self.background.submit(self.gate.wait, key='k')
+        other = self.background.submit(self.gate.wait, key='other')
+        
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
+        self.assertEqual(first.coalesced, 1)
+        self.gate.set()
+        first.result(timeout=5)
+        time.sleep(0.01)
+        self.assertIsNot(self.background.submit(abs, (-1,), key='k'), first) # done: a new job
+    
+    def test_task_key_and_callbacks(self):
+        fired = []
+        self.background.callbacks.append(fired.append)
+        
+        @self.background.task(key=True)
+        def slow(x):
+            self.gate.wait()
+            return x
+        
+        futures = [slow(1), slow(1), slow(2)]
+        self.assertIs(futures[0], futures[1])
+        self.gate.set()
+        concurrent.futures.wait(futures, timeout=5)
+        time.sleep(0.01)
+        self.assertEqual(sorted(future.result() for future in fired), [1, 2])
+    
+    def test_concurrent_coalesced_calls_fire_callbacks_once(self):
+        fired = []
+        self.background.callbacks.append(fired.append)
+        
+        @self.background.task(key=True)
+        def job(i):
+            time.sleep(0.02)
+            return i
+        
+        for i in range(20):
+            fired.clear()
+            barrier = threading.Barrier(8)
+            futures = []
+            def call():
+                barrier.wait()
+                futures.append(job(i))
+            threads = [threading.Thread(target=call) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            concurrent.futures.wait(futures, timeout=5)
+            time.sleep(0.01)
+            self.assertEqual(len(fired), len({id(future) for future in futures}))
+    
+    def test_priorities(self):
+        background = Background(n=1)
+        order = []
+        background.submit(self.gate.wait)
+        time.sleep(0.05)
+        futures = [background.submit(order.append, (p,), priority=p) for p in (1, 3, 2)]
+        self.gate.set()
+        concurrent.futures.wait(futures, timeout=5)
+        
+        self.assertEqual(order, [3, 2, 1])
+        background.shutdown()
+    
+    def test_process_backend(self):
+        future = self.background.submit(crunch, (1000,), backend='process')
+        
+        self.assertEqual(future.result(timeout=30), sum(i * i for i in range(1000)))
+        self.assertEqual(future.source_function, 'crunch')
+    
+    def test_asyncio_backend(self):
+        async def nap(x):
+            await asyncio.sleep(0.2)
+            return x
+        
+        started = time.perf_counter()
+        futures = [self.background.run(nap, i) for i in range(50)] # coroutines always go to the loop
+        
+        self.assertEqual([future.result(timeout=5) for future in futures], list(range(50)))
+        self.assertLess(time.perf_counter() - started, 1) # concurrently, on one thread
+        self.assertEqual(self.background.stats()['asyncio_jobs'], 0)
+    
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            Background(backend='fiber')
+        with self.assertRaises(ValueError):
+            self.background.submit(abs, (1,), backend='fiber')
+
+
 '''
 Example usage here
 '''
@@ -45,11 +505,16 @@ if __name__ == "__main__":
         time.sleep(3)
         return "Done!"
     
-    @background.task
+    @background.task(priority=1, key=True)
     def hello():
         time.sleep(2)
         return "Hello!"
 
+    @background.task
+    async def fetch():
+        await asyncio.sleep(1)
+        return "Fetched!"
+
     @background.callback
     def work_callback(future):
         print('from', future.source_function, 'received', future.result(),'\n\n')
@@ -57,4 +522,8 @@ if __name__ == "__main__":
     work()
     work()
     hello()
-    hello()
\ No newline at end of file
+    hello()
+    crunched = background.submit(crunch, (10_000_000,), backend='process')
+    fetch()
+    print(background.stats())
+    print('from crunch received', crunched.result())
@@ -75,6 +75,23 @@ Other functions:
     >>> c.std_err
     <open file '<fdopen>', mode 'rU' at 0x10a5351e0>
 
+    # Stream huge outputs line by line, keeping only the last 100 lines in c.out.
+    >>> c = delegator.run('make', stream=True, tail=100)
+    >>> for name, line in c.iter_output():
+    ...     print(name, line, end='')
+
+    # From asyncio, without a thread per command.
+    >>> c = await delegator.arun('ls')
+    >>> c = await delegator.arun('passwd', block=False)
+    >>> await c.expect('Password:')
+    >>> await c.send('PASSWORD')
+    >>> await c.block()
+
+    # Join the stages of a chain by OS pipes, like a shell does, and stream the end of it.
+    >>> c = delegator.chain('cat huge.log | grep ERROR | sort', stream=True)
+    >>> for name, line in c.iter_output():
+    ...     print(line, end='')
+
     # Adjust environment variables for the command (existing will be overwritten).
     >>> c = delegator.chain('env | grep NEWENV', env={'NEWENV': 'FOO_BAR'})
     >>> c.out
@@ -100,6 +117,13 @@ import signal
 import sys
 import locale
 import errno
+import codecs
+import asyncio
+import re
+import queue
+import selectors
+import threading
+from collections import deque
 
 from pexpect.popen_spawn import PopenSpawn
 import pexpect
@@ -142,6 +166,48 @@ def pid_exists(pid):
         return True
 
 
+def _read_pipes_threaded(pipes, chunk_size):
+    """_read_pipes for platforms without select() on pipes: one reader thread per pipe."""
+    chunks = queue.Queue(maxsize=16) # bounded, so readers wait for a slow consumer
+
+    def reader(name, pipe):
+        while True:
+            data = os.read(pipe.fileno(), chunk_size)
+            chunks.put((name, data))
+            if not data:
+                return
+
+    for name, pipe in pipes:
+        threading.Thread(target=reader, args=(name, pipe), daemon=True).start()
+    open_pipes = len(pipes)
+    while open_pipes:
+        name, data = chunks.get()
+        if not data:
+            open_pipes -= 1
+        yield name, data
+
+
+def _read_pipes(pipes, chunk_size=65536):
+    """Yields (name, bytes) from all (name, pipe) pairs as data arrives, and (name, b'') once a pipe is closed.
+
+    Reading every pipe as soon as it is readable is what keeps a process
+    that fills one pipe from blocking while we wait on the other, without
+    buffering whole outputs like communicate() does.
+    """
+    if sys.platform == "win32":
+        yield from _read_pipes_threaded(pipes, chunk_size)
+        return
+    with selectors.DefaultSelector() as selector:
+        for name, pipe in pipes:
+            selector.register(pipe.fileno(), selectors.EVENT_READ, name)
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = os.read(key.fd, chunk_size)
+                if not data:
+                    selector.unregister(key.fd)
+                yield key.data, data
+
+
 class Command(object):
     def __init__(self, cmd, timeout=TIMEOUT):
         super(Command, self).__init__()
@@ -149,9 +215,14 @@ class Command(object):
         self.timeout = timeout
         self.subprocess = None
         self.blocking = None
+        self.streaming = False
+        self.binary = False
+        self.tail = None
+        self.stages = [] # the Popen of every stage, for a pipeline
         self.was_run = False
         self.__out = None
         self.__err = None
+        self.__consumed = False
 
     def __repr__(self):
         return "<Command {!r}>".format(self.cmd)
@@ -219,7 +290,9 @@ class Command(object):
         if self.__out is not None:
             return self.__out
 
-        if self._uses_subprocess:
+        if self.streaming:
+            self.block()
+        elif self._uses_subprocess:
             self.__out = self.std_out.read()
         else:
             self.__out = self._pexpect_out
@@ -236,7 +309,9 @@ class Command(object):
         if self.__err is not None:
             return self.__err
 
-        if self._uses_subprocess:
+        if self.streaming:
+            self.block()
+        elif self._uses_subprocess:
             self.__err = self.std_err.read()
         else:
             self.__err = self._pexpect_out
@@ -269,9 +344,16 @@ class Command(object):
     def std_in(self):
         return self.subprocess.stdin
 
-    def run(self, block=True, binary=False, cwd=None, env=None):
-        """Runs the given command, with or without pexpect functionality enabled."""
-        self.blocking = block
+    def run(self, block=True, binary=False, cwd=None, env=None, stream=False, tail=None):
+        """Runs the given command, with or without pexpect functionality enabled.
+
+        With stream=True the output is not collected: read it with
+        iter_output(), and .out/.err keep only its last `tail` lines.
+        """
+        self.blocking = block or stream
+        self.streaming = stream
+        self.binary = binary
+        self.tail = tail
 
         # Use subprocess.
         if self.blocking:
@@ -296,6 +378,7 @@ class Command(object):
             pexpect_kwargs["env"]["PYTHONUNBUFFERED"] = "1"
             s = PopenSpawn(self._popen_args, **pexpect_kwargs)
         self.subprocess = s
+        self.stages = [s] if self.streaming else []
         self.was_run = True
 
     def expect(self, pattern, timeout=-1):
@@ -332,9 +415,115 @@ class Command(object):
         else:
             self.subprocess.send_signal(signal.SIGINT)
 
+    def iter_output(self, lines=True, chunk_size=65536):
+        """Yields ('stdout', data) and ('stderr', data) as the process writes them.
+
+        Both pipes are read concurrently, so memory stays constant however
+        much the process prints. lines=True yields lines (with their line
+        ending), lines=False chunks of up to chunk_size as they were read;
+        str, or bytes if run with binary=True. The last `tail` items of each
+        stream are kept for .out and .err.
+        Only for commands run with stream=True, and only once.
+        """
+        if not self.streaming:
+            raise RuntimeError("iter_output can only be used on commands run with stream=True.")
+        if self.__consumed:
+            raise RuntimeError("the output of this command was already consumed.")
+        self.__consumed = True
+        return self._iter_output(lines, chunk_size)
+
+    def _iter_output(self, lines, chunk_size):
+        pipes = self._output_pipes()
+        kept = {"stdout": deque(maxlen=self.tail or 0), "stderr": deque(maxlen=self.tail or 0)}
+        partial = [b""] * len(pipes) # per pipe: a pipeline's stages each have their own stderr
+        if not self.binary:
+            encoding = locale.getpreferredencoding(False)
+            decoders = [codecs.getincrementaldecoder(encoding)(errors="replace") for _ in pipes]
+
+        def convert(i, data, final=False):
+            return data if self.binary else decoders[i].decode(data, final)
+
+        try:
+            for i, data in _read_pipes([(i, pipe) for i, (_, pipe) in enumerate(pipes)], chunk_size):
+                if lines:
+                    *complete, partial[i] = (partial[i] + data).split(b"\n")
+                    items = [convert(i, line + b"\n") for line in complete]
+                    if not data and partial[i]: # last line without a line ending
+                        items.append(convert(i, partial[i], final=True))
+                        partial[i] = b""
+                else:
+                    items = [convert(i, data, final=not data)]
+                name = pipes[i][0]
+                for item in items:
+                    if item:
+                        kept[name].append(item)
+                        yield name, item
+        finally:
+            for _, pipe in pipes:
+                pipe.close()
+            for stage in self.stages:
+                stage.wait()
+            empty = b"" if self.binary else ""
+            self.__out = empty.join(kept["stdout"])
+            self.__err = empty.join(kept["stderr"])
+
+    def _output_pipes(self):
+        """The last stage's stdout and the stderr of every stage."""
+        return [("stdout", self.std_out)] + [("stderr", stage.stderr) for stage in self.stages]
+
+    def run_pipeline(self, commands, binary=False, cwd=None, env=None, tail=None):
+        """Starts all commands at once, each one's stdout connected to the next one's stdin.
+
+        Like a shell pipeline, the stages are joined by OS pipes: data goes
+        from one process to the next without passing through Python, and
+        all stages run concurrently. The command streams as with
+        run(stream=True); return_code is the last stage's.
+
+        A stage that cannot be started raises (e.g. FileNotFoundError), once
+        the stages started before it are killed and reaped.
+        """
+        popen_kwargs = self._default_popen_kwargs.copy()
+        del popen_kwargs["shell"], popen_kwargs["universal_newlines"], popen_kwargs["bufsize"]
+        if cwd:
+            popen_kwargs["cwd"] = cwd
+        if env:
+            popen_kwargs["env"].update(env)
+        self.blocking = self.streaming = True
+        self.binary = binary
+        self.tail = tail
+        self.stages = []
+        upstream = None
+        try:
+            for args in commands:
+                popen_kwargs["stdin"] = upstream
+                stage = subprocess.Popen(args, **popen_kwargs)
+                if upstream is not None:
+                    # only the child reads it now; closing our copy lets the upstream
+                    # stage get SIGPIPE if this one exits early, as in a shell
+                    upstream.close()
+                upstream = stage.stdout
+                self.stages.append(stage)
+        except Exception:
+            for stage in self.stages:
+                stage.kill()
+                stage.wait()
+                for pipe in (stage.stdout, stage.stderr):
+                    pipe.close()
+            raise
+        for stage in self.stages[:-1]:
+            stage.stdout = None # handed over to the next stage
+        self.subprocess = self.stages[-1]
+        self.was_run = True
+
     def block(self):
         """Blocks until process is complete."""
-        if self._uses_subprocess:
+        if self.streaming:
+            if not self.__consumed: # drain the pipes, keeping only the tail
+                for _ in self.iter_output():
+                    pass
+            for stage in self.stages:
+                stage.wait()
+        elif self._uses_subprocess:
             # consume stdout and stderr
             if self.blocking:
                 try:
@@ -380,6 +569,151 @@ class Command(object):
         return c
 
 
+class AsyncCommand(object):
+    """Asyncio counterpart of Command: one event loop can drive any number of them.
+
+    Built on asyncio.create_subprocess_exec; string commands run through
+    /bin/sh -c, like Command runs them with shell=True. Get one from arun()
+    or achain().
+    """
+
+    def __init__(self, cmd, timeout=TIMEOUT):
+        super(AsyncCommand, self).__init__()
+        self.cmd = cmd
+        self.timeout = timeout
+        self.subprocess = None
+        self.stages = []
+        self.blocking = None
+        self.binary = False
+        self.out = None
+        self.err = None
+        self.before = None
+        self.after = None
+        self._buffer = b""
+        self._stderr_reader = None
+
+    def __repr__(self):
+        return "<AsyncCommand {!r}>".format(self.cmd)
+
+    @property
+    def _exec_args(self):
+        if isinstance(self.cmd, STR_TYPES):
+            return ["/bin/sh", "-c", self.cmd]
+        return list(self.cmd)
+
+    @property
+    def pid(self):
+        return self.subprocess.pid
+
+    @property
+    def return_code(self):
+        return self.subprocess.returncode
+
+    @property
+    def ok(self):
+        return self.return_code == 0
+
+    def _decode(self, data):
+        return data if self.binary else data.decode(locale.getpreferredencoding(False), errors="replace")
+
+    def _encode(self, data):
+        return data if isinstance(data, bytes) else data.encode(locale.getpreferredencoding(False))
+
+    async def run(self, block=True, binary=False, cwd=None, env=None):
+        """Starts the command. Non-blocking commands get a stdin for send() and expect() on their stdout."""
+        self.blocking = block
+        self.binary = binary
+        process_env = os.environ.copy()
+        if env:
+            process_env.update(env)
+        if not block:
+            process_env["PYTHONUNBUFFERED"] = "1"
+        self.subprocess = await asyncio.create_subprocess_exec(
+            *self._exec_args,
+            stdin=None if block else asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            env=process_env,
+        )
+        self.stages = [self.subprocess]
+        if not block: # keep stderr flowing while the caller talks to stdout
+            self._stderr_reader = asyncio.ensure_future(self.subprocess.stderr.read())
+
+    async def expect(self, pattern, timeout=-1):
+        """Waits on the given pattern (str, bytes or compiled regex) to appear in std_out.
+
+        Sets before and after like pexpect and returns the match, or None if
+        the output ended first. Raises TimeoutError after timeout seconds
+        (-1 for the command's timeout, None to wait forever).
+        """
+        if self.blocking:
+            raise RuntimeError("expect can only be used on non-blocking commands.")
+        if timeout == -1:
+            timeout = self.timeout
+        if isinstance(pattern, STR_TYPES):
+            pattern = self._encode(pattern)
+        if isinstance(pattern, bytes):
+            pattern = re.compile(pattern)
+        elif isinstance(pattern.pattern, str):
+            pattern = re.compile(self._encode(pattern.pattern), pattern.flags & ~re.UNICODE)
+
+        async def read_until_match():
+            while True:
+                match = pattern.search(self._buffer)
+                if match:
+                    return match
+                data = await self.subprocess.stdout.read(65536)
+                if not data:
+                    return None
+                self._buffer += data
+
+        match = await asyncio.wait_for(read_until_match(), timeout)
+        if match is None:
+            self.before, self.after = self._decode(self._buffer), None
+            self._buffer = b""
+            return None
+        self.before = self._decode(self._buffer[:match.start()])
+        self.after = self._decode(match.group())
+        self._buffer = self._buffer[match.end():]
+        return match
+
+    async def send(self, s, end=os.linesep, signal=False):
+        """Sends the given string or signal to std_in."""
+        if self.blocking:
+            raise RuntimeError("send can only be used on non-blocking commands.")
+        if signal:
+            self.subprocess.send_signal(s)
+            return
+        self.subprocess.stdin.write(self._encode(s + end))
+        await self.subprocess.stdin.drain()
+
+    def terminate(self):
+        self.subprocess.terminate()
+
+    def kill(self):
+        self.subprocess.send_signal(signal.SIGINT)
+
+    async def block(self):
+        """Waits until the process is complete and collects out and err.
+
+        For a non-blocking command, out is what expect() did not consume,
+        like Command.out after pexpect.
+        """
+        if self.blocking:
+            stdout, stderr = await self.subprocess.communicate()
+        else:
+            if self.subprocess.stdin and not self.subprocess.stdin.is_closing():
+                self.subprocess.stdin.close()
+            stdout = (self._encode(self.before or "") + self._encode(self.after or "") + self._buffer
+                      + await self.subprocess.stdout.read())
+            stderr = await self._stderr_reader
+            await self.subprocess.wait()
+        self.out = self._decode(stdout)
+        self.err = self._decode(stderr)
+        return self
+
+
 def _expand_args(command):
     """Parses command strings and returns a Popen-ready list."""
 
@@ -407,8 +741,27 @@ def _expand_args(command):
     return command
 
 
-def chain(command, timeout=TIMEOUT, cwd=None, env=None):
+def chain(command, timeout=TIMEOUT, cwd=None, env=None, pipes=False, stream=False, binary=False, tail=None):
+    """Runs a ``a | b | c`` chain of commands.
+
+    By default every stage runs to completion and its .out is sent to the
+    next one. With pipes=True the stages run concurrently, joined by OS
+    pipes (see Command.run_pipeline), and the call returns once they are
+    done with the full output in .out. stream=True also joins them by OS
+    pipes but returns right away, for iter_output() and a `tail`.
+
+    A stage that cannot be started raises, e.g. FileNotFoundError. Without
+    pipes the stages before it have already run to completion; with pipes or
+    stream they were running alongside, and are killed first.
+    """
     commands = _expand_args(command)
+    if pipes or stream:
+        c = Command(command, timeout=timeout)
+        c.run_pipeline(commands, binary=binary, cwd=cwd, env=env, tail=tail if stream else sys.maxsize)
+        if not stream:
+            c.block()
+        return c
+
     data = None
 
     for command in commands:
@@ -424,11 +777,231 @@ def chain(command, timeout=TIMEOUT, cwd=None, env=None):
     return c
 
 
-def run(command, block=True, binary=False, timeout=TIMEOUT, cwd=None, env=None):
+def run(command, block=True, binary=False, timeout=TIMEOUT, cwd=None, env=None, stream=False, tail=None):
     c = Command(command, timeout=timeout)
-    c.run(block=block, binary=binary, cwd=cwd, env=env)
+    c.run(block=block, binary=binary, cwd=cwd, env=env, stream=stream, tail=tail)
+
+    if block and not stream:
+        c.block()
+
+    return c
+
+async def arun(command, block=True, binary=False, timeout=TIMEOUT, cwd=None, env=None):
+    """Asyncio counterpart of run(): await it instead of blocking a thread per command."""
+    c = AsyncCommand(command, timeout=timeout)
+    await c.run(block=block, binary=binary, cwd=cwd, env=env)
 
     if block:
+        await c.block()
+
+    return c
+
+
+async def achain(command, timeout=TIMEOUT, cwd=None, env=None, binary=False):
+    """Asyncio counterpart of chain(..., pipes=True): stages joined by OS pipes, run concurrently."""
+    commands = _expand_args(command)
+    process_env = os.environ.copy()
+    if env:
+        process_env.update(env)
+    c = AsyncCommand(command, timeout=timeout)
+    c.blocking = True
+    c.binary = binary
+    upstream = None
+    try:
+        for i, args in enumerate(commands):
+            last = i == len(commands) - 1
+            read_end, write_end = (None, asyncio.subprocess.PIPE) if last else os.pipe()
+            stdin, upstream = upstream, read_end
+            try:
+                stage = await asyncio.create_subprocess_exec(
+                    *args, stdin=stdin, stdout=write_end, stderr=asyncio.subprocess.PIPE,
+                    cwd=cwd, env=process_env,
+                )
+            finally: # the children hold their own copies
+                if stdin is not None:
+                    os.close(stdin)
+                if not last:
+                    os.close(write_end)
+            c.stages.append(stage)
+    except Exception:
+        if upstream is not None:
+            os.close(upstream)
+        for stage in c.stages:
+            stage.kill()
+            await stage.wait()
+        raise
+    c.subprocess = c.stages[-1]
+
+    stdout, *stderrs = await asyncio.gather(c.subprocess.stdout.read(), *(stage.stderr.read() for stage in c.stages))
+    for stage in c.stages:
+        await stage.wait()
+    c.out = c._decode(stdout)
+    c.err = c._decode(b"".join(stderrs))
+    return c
+
+
+
+
+
+
+
+
+
+##### TESTS #####
+
+
+import time
+import unittest
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_interleaved_streams(self):
+        c = run("echo o1; echo e1 >&2; sleep 0.1; echo o2; echo e2 >&2", stream=True)
+        items = list(c.iter_output())
+
+        self.assertEqual([data for name, data in items if name == "stdout"], ["o1\n", "o2\n"])
+        self.assertEqual([data for name, data in items if name == "stderr"], ["e1\n", "e2\n"])
+        self.assertLess(items.index(("stderr", "e1\n")), items.index(("stdout", "o2\n")))
+        self.assertEqual(c.return_code, 0)
+
+    def test_last_line_without_line_ending(self):
+        c = run("printf 'a\\nb'", stream=True)
+
+        self.assertEqual(list(c.iter_output()), [("stdout", "a\n"), ("stdout", "b")])
+
+    def test_tail(self):
+        c = run("seq 1 100000", stream=True, tail=3)
         c.block()
 
-    return c
\ No newline at end of file
+        self.assertEqual(c.out, "99998\n99999\n100000\n")
+        self.assertEqual(c.err, "")
+
+    def test_chunks(self):
+        c = run("seq 1 100000", stream=True)
+        chunks = [data for _, data in c.iter_output(lines=False, chunk_size=4096)]
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 4096 for chunk in chunks))
+        self.assertEqual("".join(chunks), "".join(f"{i}\n" for i in range(1, 100001)))
+
+    def test_binary(self):
+        c = run("printf 'x\\377\\ny'", stream=True, binary=True)
+
+        self.assertEqual(list(c.iter_output()), [("stdout", b"x\xff\n"), ("stdout", b"y")])
+
+    def test_iter_output_only_once_and_only_streaming(self):
+        c = run("echo hi", stream=True)
+        list(c.iter_output())
+        with self.assertRaises(RuntimeError):
+            c.iter_output()
+        with self.assertRaises(RuntimeError):
+            run("echo hi").iter_output()
+
+
+def _children(state=None):
+    """Pids of this process's children (Linux), only those in the given state if one is given."""
+    pids = []
+    for entry in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (FileNotFoundError, ProcessLookupError): # exited meanwhile
+            continue
+        if int(fields[1]) == os.getpid() and (state is None or fields[0] == state):
+            pids.append(int(entry))
+    return pids
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_pipes(self):
+        c = chain("printf 'b\\na\\nc\\n' | sort | tr a-z A-Z", pipes=True)
+
+        self.assertEqual(c.out, "A\nB\nC\n")
+        self.assertEqual(c.return_code, 0)
+        self.assertEqual(len(c.stages), 3)
+
+    def test_stream(self):
+        c = chain("seq 1 5 | tail -n 2", stream=True)
+
+        self.assertEqual(list(c.iter_output()), [("stdout", "4\n"), ("stdout", "5\n")])
+        self.assertEqual(c.return_code, 0)
+
+    def test_upstream_gets_sigpipe(self):
+        c = chain("yes | head -n 3", pipes=True) # yes would run forever without SIGPIPE
+
+        self.assertEqual(c.out, "y\ny\ny\n")
+        self.assertEqual(c.stages[0].returncode, -signal.SIGPIPE)
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "needs /proc")
+    def test_stage_that_cannot_start(self):
+        fds = len(os.listdir("/proc/self/fd"))
+        for _ in range(5):
+            with self.assertRaises(FileNotFoundError):
+                chain("sleep 5 | sleep 5 | no-such-command-here", pipes=True)
+
+        self.assertEqual(len(os.listdir("/proc/self/fd")), fds)
+        self.assertEqual(_children("Z"), [])
+
+
+class TestAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def test_arun(self):
+        c = await arun("echo hi; echo err >&2; exit 3")
+
+        self.assertEqual((c.out, c.err, c.return_code, c.ok), ("hi\n", "err\n", 3, False))
+        self.assertEqual((await arun(["printf", "a b"])).out, "a b")
+
+    async def test_arun_concurrently(self):
+        started = time.time()
+        commands = await asyncio.gather(*(arun(f"sleep 0.5; echo {i}") for i in range(50)))
+
+        self.assertEqual([c.out for c in commands], [f"{i}\n" for i in range(50)])
+        self.assertLess(time.time() - started, 3)
+
+    async def test_expect_and_send(self):
+        c = await arun("printf 'Password: '; read x; echo \"got $x\"; echo bye", block=False)
+        await c.expect("Password:")
+        await c.send("secret")
+        match = await c.expect(r"got (\w+)")
+
+        self.assertEqual(match.group(1), b"secret") # matched on the raw output
+        self.assertEqual(c.after, "got secret")
+        await c.block()
+        self.assertEqual(c.return_code, 0)
+        self.assertIn("bye", c.out)
+
+    async def test_expect_timeout(self):
+        c = await arun("sleep 5", block=False)
+        with self.assertRaises(TimeoutError):
+            await c.expect("never", timeout=0.2)
+        c.kill()
+        await c.block()
+
+    async def test_expect_eof(self):
+        c = await arun("echo done", block=False)
+
+        self.assertIsNone(await c.expect("never", timeout=5))
+        await c.block()
+
+    async def test_achain(self):
+        c = await achain("seq 1 1000 | grep 7 | wc -l")
+
+        self.assertEqual(c.out.strip(), "271")
+        self.assertEqual((c.return_code, len(c.stages)), (0, 3))
+        self.assertIn("No such file", (await achain("ls /nonexistent | cat")).err)
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "needs /proc")
+    async def test_achain_stage_that_cannot_start(self):
+        fds = len(os.listdir("/proc/self/fd"))
+        for _ in range(5):
+            with self.assertRaises(FileNotFoundError):
+                await achain("sleep 5 | sleep 5 | no-such-command-here")
+
+        self.assertEqual(len(os.listdir("/proc/self/fd")), fds)
+        self.assertEqual(_children("Z"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
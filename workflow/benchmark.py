@@ -0,0 +1,233 @@
+"""
+Scheduler benchmarks on synthetic graphs.
+
+    python benchmark.py                                  # default suite, saved as benchmark_results/<commit>.json
+    python benchmark.py --shapes chain fan --sizes 10 100000 --bodies noop
+    python benchmark.py --compare benchmark_results/abc1234.json benchmark_results/def5678.json
+
+Every case builds a fresh graph of one shape (chain, fan, random, diamond,
+agentic) and task body (noop, sleep, cpu), runs it through run_graph with a
+RunTracer, then reports:
+
+- tasks_per_sec: nodes / makespan
+- queue_wait_p50/p99: from a task becoming ready to it starting on a worker
+- overhead_per_task: (makespan - ideal_makespan) / nodes
+- ideal_makespan: max(critical path, total work / workers), from the measured
+  task durations, and efficiency = ideal_makespan / makespan
+- peak_memory: tracemalloc peak of run_graph over a second, untimed run of
+  the same graph (the graph itself is built before tracing starts)
+
+Results of one invocation go to a single JSON file keyed by commit, so runs
+on different commits can be compared case by case.
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from monitor import RunTracer
+from run import run_graph
+from task import Task, Binding
+
+
+def noop(*inputs, **named):
+    return 1
+
+def sleep(*inputs, **named):
+    time.sleep(0.001)
+    return 1
+
+def cpu(*inputs, **named):
+    return sum(i * i for i in range(20_000)) and 1
+
+BODIES = {'noop': noop, 'sleep': sleep, 'cpu': cpu}
+MAX_NODES = {'noop': None, 'sleep': 2_000, 'cpu': 2_000} # keep the default suite under a few minutes
+
+
+def make_task(body, name, parents):
+    return Task(body, name=name, fn_args=[Binding(p) for p in parents], ready=not parents)
+
+def chain(n, body):
+    """n tasks, each depending on the previous one: no parallelism at all."""
+    tasks = []
+    for i in range(n):
+        tasks.append(make_task(body, f'chain-{i}', tasks[-1:]))
+    return tasks
+
+def fan(n, body):
+    """One root, n - 2 independent tasks on it, one sink gathering all of them."""
+    root = make_task(body, 'fan-root', [])
+    middle = [make_task(body, f'fan-{i}', [root]) for i in range(max(n - 2, 0))]
+    return [root, *middle, make_task(body, 'fan-sink', middle)]
+
+def random_dag(n, body, max_parents=3, window=100, seed=0):
+    """Each task depends on up to max_parents of the window tasks created just before it."""
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(n):
+        candidates = tasks[max(0, i - window):]
+        parents = rng.sample(candidates, min(len(candidates), rng.randint(0, max_parents)))
+        tasks.append(make_task(body, f'random-{i}', parents))
+    return tasks
+
+def diamond(n, body):
+    """A lattice of sqrt(n)-wide rows, each task depending on two neighbours in the row above."""
+    width = max(int(n ** 0.5), 1)
+    tasks = []
+    for i in range(n):
+        row, column = divmod(i, width)
+        above = (row - 1) * width
+        parents = tasks[above + max(column - 1, 0):above + column + 1] if row else []
+        tasks.append(make_task(body, f'diamond-{i}', parents))
+    return tasks
+
+
+def agentic(n, body):
+    """
+    Copies of the example graph of parallel/agentic_workflow.py with body swapped
+    in, so that entry point is measured by the same suite as the engine itself.
+    """
+    sys.path.append(str(Path(__file__).parent.parent / 'parallel'))
+    from agentic_workflow import build_tasks
+    tasks = []
+    for i in range(max(n // 6, 1)):
+        for task in build_tasks():
+            task.fn = body
+            task.name = f'agentic-{task.name}-{i}'
+            tasks.append(task)
+    return tasks
+
+SHAPES = {'chain': chain, 'fan': fan, 'random': random_dag, 'diamond': diamond, 'agentic': agentic}
+
+
+def parents_of(task):
+    return [binding.source for binding in (*task.fn_args, *task.fn_kwargs.values())]
+
+def ideal_makespan(parents, durations, workers):
+    """Lower bound on the makespan: the longer of the critical path and the total work spread over all workers."""
+    finish = {}
+    for task, sources in parents.items(): # generators emit tasks in topological order
+        finish[task] = max((finish[p] for p in sources), default=0.0) + durations[task.name]
+    critical_path = max(finish.values(), default=0.0)
+    return max(critical_path, sum(durations.values()) / workers), critical_path
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))] if values else 0.0
+
+def run_case(shape, nodes, body, mode='thread', max_workers=10, memory=True):
+    tasks = SHAPES[shape](nodes, BODIES[body])
+    parents = {task: parents_of(task) for task in tasks} # bindings are replaced by values once run
+    tracer = RunTracer()
+    started = time.perf_counter()
+    for _ in run_graph(tasks, max_workers=max_workers, mode=mode, tracer=tracer, verbose=False):
+        pass
+    makespan = time.perf_counter() - started
+    
+    records = tracer.report()['tasks']
+    durations = {r['name']: r['duration'] for r in records}
+    ideal, critical_path = ideal_makespan(parents, durations, max_workers)
+    queue_waits = [r['queue_wait'] for r in records]
+    result = {
+        'shape': shape, 'nodes': len(tasks), 'edges': sum(map(len, parents.values())),
+        'body': body, 'mode': mode, 'max_workers': max_workers,
+        'makespan': makespan,
+        'tasks_per_sec': len(tasks) / makespan if makespan else 0.0,
+        'queue_wait_p50': percentile(queue_waits, 50),
+        'queue_wait_p99': percentile(queue_waits, 99),
+        'overhead_per_task': (makespan - ideal) / len(tasks),
+        'critical_path': critical_path,
+        'ideal_makespan': ideal,
+        'efficiency': ideal / makespan if makespan else 0.0,
+        'peak_memory': None,
+    }
+    if memory: # separate run, tracemalloc slows down every allocation
+        tasks = SHAPES[shape](nodes, BODIES[body])
+        tracemalloc.start()
+        for _ in run_graph(tasks, max_workers=max_workers, mode=mode, verbose=False):
+            pass
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+def case_key(case):
+    return case['shape'], case['nodes'], case['body'], case['mode'], case['max_workers']
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(shapes=SHAPES, sizes=(10, 100, 1_000, 10_000, 100_000), bodies=BODIES, mode='thread', max_workers=10, memory=True):
+    cases = []
+    for body in bodies:
+        for shape in shapes:
+            for nodes in sizes:
+                if MAX_NODES[body] and nodes > MAX_NODES[body]:
+                    continue
+                case = run_case(shape, nodes, body, mode, max_workers, memory)
+                print(f"{shape:>8} {body:>5} {case['nodes']:>7} nodes  {case['tasks_per_sec']:>10.0f} tasks/s  "
+                      f"p99 wait {case['queue_wait_p99'] * 1e3:8.2f} ms  efficiency {case['efficiency']:6.1%}  "
+                      f"peak {(case['peak_memory'] or 0) / 2**20:7.1f} MiB", flush=True)
+                cases.append(case)
+    return {
+        'commit': current_commit(),
+        'created': time.time(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'cases': cases,
+    }
+
+def save(results, path=None):
+    path = path or os.path.join('benchmark_results', f"{results['commit'] or int(results['created'])}.json")
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+def compare(baseline_path, current_path):
+    """Prints tasks/sec and peak memory of the cases both result files have, current relative to baseline."""
+    with open(baseline_path) as f:
+        baseline = {case_key(c): c for c in json.load(f)['cases']}
+    with open(current_path) as f:
+        current = json.load(f)['cases']
+    for case in current:
+        before = baseline.get(case_key(case))
+        if before is None:
+            continue
+        speedup = case['tasks_per_sec'] / before['tasks_per_sec'] if before['tasks_per_sec'] else float('nan')
+        memory = (case['peak_memory'] / before['peak_memory']
+                  if case['peak_memory'] and before['peak_memory'] else float('nan'))
+        print(f"{case['shape']:>8} {case['body']:>5} {case['nodes']:>7} nodes  "
+              f"tasks/s x{speedup:5.2f}  peak memory x{memory:5.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=list(SHAPES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1_000, 10_000, 100_000])
+    parser.add_argument('--bodies', nargs='+', choices=BODIES, default=list(BODIES))
+    parser.add_argument('--mode', choices=['thread', 'process', 'hybrid'], default='thread')
+    parser.add_argument('--max-workers', type=int, default=10)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--out', help='result file, defaults to benchmark_results/<commit>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='compare two result files and exit')
+    args = parser.parse_args()
+    
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+    results = run_suite(args.shapes, args.sizes, args.bodies, args.mode, args.max_workers, not args.no_memory)
+    print('saved to', save(results, args.out))
@@ -0,0 +1,120 @@
+from multiprocessing import resource_tracker, shared_memory
+
+
+class SharedBuffer:
+    """
+    Bytes in shared memory, for large outputs fanned out to many consumers.
+    
+    A SharedBuffer pickles as the name of its segment, so handing it to a
+    task in a worker process ships a few bytes instead of the data, and
+    view() is a memoryview over the segment, so reading it copies nothing.
+    A task can return one from a worker process as well. Call release() once
+    no task needs it anymore; until then the segment stays allocated.
+    """
+    def __init__(self, shm, size):
+        self._shm = shm
+        self.size = size
+        # the lifetime is release()'s business: left registered, the resource
+        # tracker of a pool worker would unlink the segment when the pool shuts down
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    
+    @classmethod
+    def from_bytes(cls, data):
+        shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        shm.buf[:len(data)] = data
+        return cls(shm, len(data))
+    
+    @classmethod
+    def attach(cls, name, size):
+        return cls(shared_memory.SharedMemory(name=name), size)
+    
+    @property
+    def name(self):
+        return self._shm.name
+    
+    def view(self):
+        """Zero-copy memoryview of the data."""
+        return self._shm.buf[:self.size]
+    
+    def __len__(self):
+        return self.size
+    
+    def __bytes__(self):
+        return bytes(self.view())
+    
+    def __reduce__(self):
+        return (SharedBuffer.attach, (self.name, self.size))
+    
+    def release(self):
+        """Frees the segment, in every process."""
+        resource_tracker.register(self._shm._name, 'shared_memory') # unlink() unregisters it
+        self._shm.close()
+        self._shm.unlink()
+    
+    def __repr__(self):
+        return f"<SharedBuffer {self.name} {self.size} bytes>"
+
+
+
+
+
+
+
+
+
+##### TESTS #####
+
+
+import os
+import unittest
+
+from run import run_graph
+from task import Binding, Task
+
+
+def make_buffer():
+    return SharedBuffer.from_bytes(bytes(range(256)) * 4096) # 1 MiB
+
+def inspect_buffer(buffer):
+    """Runs in a worker process: reads the buffer in place."""
+    view = buffer.view()
+    summary = (len(view), sum(view[:256]), os.getpid())
+    view.release()
+    return summary
+
+
+class TestSharedBuffer(unittest.TestCase):
+    
+    def test_fan_out_to_worker_processes(self):
+        producer = Task(make_buffer, name='producer', ready=True, yielder=True)
+        consumers = [
+            Task(inspect_buffer, name=f'consumer{i}', fn_args=[Binding(producer)], cpu_bound=True, yielder=True)
+            for i in range(3)
+        ]
+        
+        outputs = {name: output for output, name in run_graph([producer, *consumers], mode='hybrid', max_processes=2, verbose=False)}
+        
+        buffer = outputs.pop('producer')
+        self.assertEqual(sorted(outputs), ['consumer0', 'consumer1', 'consumer2'])
+        for size, total, pid in outputs.values():
+            self.assertEqual((size, total), (1 << 20, sum(range(256))))
+            self.assertNotEqual(pid, os.getpid())
+        self.assertEqual(bytes(buffer)[:3], b'\x00\x01\x02')
+        
+        buffer.release()
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=buffer.name)
+    
+    def test_pickles_as_its_name(self):
+        import pickle
+        buffer = SharedBuffer.from_bytes(b'x' * 100_000)
+        try:
+            payload = pickle.dumps(buffer)
+            self.assertLess(len(payload), 200)
+            self.assertEqual(bytes(pickle.loads(payload)), b'x' * 100_000)
+        finally:
+            buffer.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
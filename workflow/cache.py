@@ -0,0 +1,194 @@
+from collections import OrderedDict
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+
+
+MISS = object()
+
+
+def canonical(obj):
+    """
+    Replaces functions and code objects by what defines their behaviour, so
+    that a key stays the same across processes (reprs of functions carry
+    memory addresses) but changes when the code or a closed-over value does.
+    A bound method also depends on the object it is bound to.
+    """
+    parents = set() # ids of the functions and containers being walked, to stop at cycles
+    
+    def walk(obj):
+        if id(obj) in parents: # e.g. a nested function calling itself through its closure
+            return ('cycle', getattr(obj, '__qualname__', type(obj).__name__))
+        if hasattr(obj, '__func__') and hasattr(obj, '__self__'):
+            return ('method', walk(obj.__func__), walk(obj.__self__))
+        if hasattr(obj, 'co_code'):
+            return ('code', obj.co_code, walk(obj.co_consts), obj.co_names)
+        if not hasattr(obj, '__code__') and not isinstance(obj, (list, tuple, dict)):
+            return obj
+        parents.add(id(obj))
+        try:
+            if isinstance(obj, (list, tuple)):
+                return tuple(walk(item) for item in obj)
+            if isinstance(obj, dict):
+                return tuple(sorted((repr(k), walk(v)) for k, v in obj.items()))
+            return (
+                'fn',
+                getattr(obj, '__module__', None),
+                getattr(obj, '__qualname__', None),
+                walk(obj.__code__),
+                walk(obj.__defaults__),
+                walk(obj.__kwdefaults__),
+                # closures matter: make_llm_fn(prompt) closures differ only by prompt
+                walk([cell_contents(cell) for cell in obj.__closure__ or ()]),
+            )
+        finally:
+            parents.discard(id(obj))
+    
+    return walk(obj)
+
+
+def cell_contents(cell):
+    try:
+        return cell.cell_contents
+    except ValueError: # the variable was not assigned yet, or was deleted
+        return ('cell', 'empty')
+
+
+def stable_bytes(obj):
+    """
+    Pickled obj, or None if it cannot be pickled. Never falls back to repr():
+    reprs carry memory addresses, which are reused once an object is freed,
+    so two different values could hash the same.
+    """
+    try:
+        return pickle.dumps(obj, protocol=4)
+    except Exception:
+        return None
+
+
+def cache_key(fn, args, kwargs):
+    """Content address of a call: hash of the function identity plus the resolved inputs. None if it cannot be hashed."""
+    data = stable_bytes(canonical((fn, args, kwargs)))
+    if data is None:
+        return None
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier memoization store for task results.
+    
+    The memory tier is an LRU of at most max_entries results. If path is
+    given, results are also kept in a sqlite file that survives the process,
+    trimmed to max_bytes (least recently used first). Entries older than
+    ttl seconds are dropped from both tiers.
+    """
+    def __init__(self, path=None, max_entries=1024, max_bytes=1 << 30, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict() # key -> (created, value)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)'
+            )
+            self._db.commit()
+            self._disk_bytes, = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()
+    
+    key = staticmethod(cache_key)
+    
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+    
+    def get(self, key):
+        """Returns the cached value, or MISS."""
+        with self._lock:
+            value = self._get(key)
+            if value is MISS:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+    
+    def _get(self, key):
+        if key in self._memory:
+            created, value = self._memory[key]
+            if not self._expired(created):
+                self._memory.move_to_end(key)
+                return value
+            del self._memory[key]
+        if self._db is None:
+            return MISS
+        row = self._db.execute('SELECT value, created FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return MISS
+        blob, created = row
+        if self._expired(created):
+            self._delete(key)
+            self._db.commit()
+            return MISS
+        self._db.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+        self._db.commit()
+        value = pickle.loads(blob)
+        self._remember(key, created, value)
+        return value
+    
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is None:
+                return
+            try:
+                blob = pickle.dumps(value)
+            except Exception: # keep unpicklable results in memory only
+                return
+            self._delete(key)
+            self._db.execute(
+                'INSERT INTO results VALUES (?, ?, ?, ?, ?)',
+                (key, blob, len(blob), now, now),
+            )
+            self._disk_bytes += len(blob)
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+    
+    def _delete(self, key):
+        row = self._db.execute('SELECT size FROM results WHERE key = ?', (key,)).fetchone()
+        if row:
+            self._db.execute('DELETE FROM results WHERE key = ?', (key,))
+            self._disk_bytes -= row[0]
+    
+    def _evict(self):
+        """Drops expired entries, then least recently used ones until under max_bytes."""
+        if self.ttl is not None:
+            self._db.execute('DELETE FROM results WHERE created < ?', (time.time() - self.ttl,))
+        self._disk_bytes, = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()
+        rows = self._db.execute('SELECT key, size FROM results ORDER BY accessed').fetchall()
+        for key, size in rows:
+            if self._disk_bytes <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM results WHERE key = ?', (key,))
+            self._disk_bytes -= size
+    
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM results')
+                self._db.commit()
+                self._disk_bytes = 0
@@ -1,15 +1,91 @@
+from collections import deque
 
 
 class CircularDependencyError(Exception):
     """Exception raised when a circular dependency is detected in the task graph."""
-    def __init__(self, cycle):
+    def __init__(self, cycle, cycles=None):
         self.cycle = cycle
-        cycle_str = " → ".join([task.name for task in cycle])
-        super().__init__(f"Circular dependency detected: {cycle_str}")
+        self.cycles = cycles or [cycle]
+        cycles_str = "; ".join(" → ".join(task.name for task in c) for c in self.cycles)
+        if len(self.cycles) == 1:
+            super().__init__(f"Circular dependency detected: {cycles_str}")
+        else:
+            super().__init__(f"{len(self.cycles)} circular dependencies detected: {cycles_str}")
+
+def find_strongly_connected_components(dependency_map):
+    """
+    Tarjan's algorithm, iterative so deep graphs never hit the recursion limit. O(V+E).
+    
+    Args:
+        dependency_map: dict of node -> list of nodes it depends on
+    
+    Returns:
+        List of the components that contain a cycle: more than one node, or a
+        node depending on itself
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+    
+    for root in dependency_map:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(dependency_map.get(root, ())))]
+        while work:
+            node, deps = work[-1]
+            for dep in deps:
+                if dep not in index:
+                    index[dep] = low[dep] = len(index)
+                    stack.append(dep)
+                    on_stack.add(dep)
+                    work.append((dep, iter(dependency_map.get(dep, ()))))
+                    break
+                if dep in on_stack:
+                    low[node] = min(low[node], index[dep])
+            else: # all deps of node explored
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member is node:
+                            break
+                    if len(component) > 1 or node in dependency_map.get(node, ()):
+                        components.append(component)
+    return components
+
+def shortest_cycle_through(start, component, dependency_map):
+    """A cycle inside a strongly connected component, as a path that ends where it starts."""
+    members = set(component)
+    parent = {start: None}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        for dep in dependency_map.get(node, ()):
+            if dep is start:
+                path = [start]
+                while node is not None:
+                    path.append(node)
+                    node = parent[node]
+                path.reverse() # start ... node, then back to start
+                return path
+            if dep in members and dep not in parent:
+                parent[dep] = node
+                queue.append(dep)
 
 def detect_circular_dependencies(tasks):
     """
-    Detects circular dependencies in the task graph using DFS.
+    Detects circular dependencies in the task graph, all of them in one O(V+E) pass.
     
     Args:
         tasks: List of Task objects
@@ -18,7 +94,8 @@ def detect_circular_dependencies(tasks):
         List of cycles found in the graph, where each cycle is a list of Task objects
     
     Raises:
-        CircularDependencyError: If a circular dependency is detected
+        CircularDependencyError: If a circular dependency is detected, with one
+            cycle per strongly connected component in its cycles attribute
     """
     # Build dependency map
     dependency_map = {}
@@ -32,41 +109,16 @@ def detect_circular_dependencies(tasks):
             dependencies.append(binding.source)
         dependency_map[task] = dependencies
     
-    # Track visited nodes and current path
-    visited = set()
-    path = []
-    path_set = set()
+    order = {task: i for i, task in enumerate(dependency_map)}
     cycles = []
-    
-    def dfs(node):
-        if node in path_set:
-            # Found a cycle
-            cycle_start_idx = path.index(node)
-            cycle = path[cycle_start_idx:] + [node]
-            cycles.append(cycle)
-            return
-        
-        if node in visited:
-            return
-            
-        visited.add(node)
-        path.append(node)
-        path_set.add(node)
-        
-        for dep in dependency_map.get(node, []):
-            dfs(dep)
-            
-        path.pop()
-        path_set.remove(node)
-    
-    # Run DFS from each node
-    for task in tasks:
-        dfs(task)
+    for component in find_strongly_connected_components(dependency_map):
+        start = min(component, key=lambda task: order.get(task, len(order)))
+        cycles.append(shortest_cycle_through(start, component, dependency_map))
+    cycles.sort(key=lambda cycle: order.get(cycle[0], len(order)))
     
     if cycles:
-        print('circular dependency detected. cycles:', cycles)
-        # Raise exception with the first cycle found
-        raise CircularDependencyError(cycles[0])
+        print('circular dependency detected. cycles:', [[task.name for task in cycle] for cycle in cycles])
+        raise CircularDependencyError(cycles[0], cycles)
     
     return cycles
 
@@ -212,9 +264,53 @@ class TestDetectCircularDependencies(unittest.TestCase):
         
         tasks = [task1, task2, task3, task4]
         
-        # Should raise CircularDependencyError for the first cycle found
-        with self.assertRaises(CircularDependencyError):
+        # Should raise CircularDependencyError reporting both cycles
+        with self.assertRaises(CircularDependencyError) as context:
             detect_circular_dependencies(tasks)
+        
+        self.assertEqual(len(context.exception.cycles), 2)
+        self.assertEqual([t.name for t in context.exception.cycles[0]], ["task1", "task2", "task1"])
+        self.assertEqual([t.name for t in context.exception.cycles[1]], ["task3", "task4", "task3"])
+    
+    def test_self_dependency(self):
+        # Test with a task depending on itself
+        task1 = Task(self.fn1, name="task1")
+        task1.fn_args = [Binding(task1)]
+        
+        with self.assertRaises(CircularDependencyError) as context:
+            detect_circular_dependencies([task1])
+        
+        self.assertIn("task1 → task1", str(context.exception))
+    
+    def test_cycle_reachable_from_acyclic_part(self):
+        # Test that tasks leading into a cycle are not reported as part of it
+        task1 = Task(self.fn1, name="task1")
+        task2 = Task(self.fn2, name="task2")
+        task3 = Task(self.fn3, name="task3")
+        
+        # task1 -> task2 <-> task3
+        task1.fn_args = [Binding(task2)]
+        task2.fn_args = [Binding(task3)]
+        task3.fn_args = [Binding(task2)]
+        
+        with self.assertRaises(CircularDependencyError) as context:
+            detect_circular_dependencies([task1, task2, task3])
+        
+        self.assertEqual([t.name for t in context.exception.cycle], ["task2", "task3", "task2"])
+    
+    def test_deep_chain_does_not_recurse(self):
+        # Test a chain far deeper than the recursion limit, closed into a cycle at the end
+        tasks = [Task(self.fn1, name="task0")]
+        for i in range(1, 100_000):
+            tasks.append(Task(self.fn1, name=f"task{i}", fn_args=[Binding(tasks[-1])]))
+        
+        self.assertEqual(detect_circular_dependencies(tasks), [])
+        
+        tasks[0].fn_args = [Binding(tasks[-1])]
+        with patch('builtins.print'):
+            with self.assertRaises(CircularDependencyError) as context:
+                detect_circular_dependencies(tasks)
+        self.assertEqual(len(context.exception.cycle), 100_001)
     
     @patch('builtins.print')
     def test_print_message_on_cycle_detection(self, mock_print):
@@ -0,0 +1,312 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import count
+from multiprocessing import Process
+from multiprocessing.connection import Client, Listener
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+from executors import GraphExecutor, run_pickled
+
+
+class WorkerLost(Exception):
+    """Raised for a task whose workers kept dying under it."""
+
+
+class Job:
+    def __init__(self, payload):
+        self.payload = payload
+        self.future = Future()
+        self.attempts = 0
+
+
+class DistributedExecutor(GraphExecutor):
+    """
+    Coordinator side: run_graph keeps the Task/Binding graph and this executor
+    ships the ready tasks to worker processes connected over sockets.
+    
+    Start workers with run_worker(executor.address, executor.authkey), from
+    this module's command line on other hosts, or use LocalCluster. Tasks are
+    pickled like in process mode, so their functions must be importable on
+    the workers. Tasks that cannot be pickled, and tasks feeding streaming
+    bindings, run on local threads instead.
+    
+    When a worker disconnects, the tasks it was running go back in the queue
+    for another worker; a task is failed with WorkerLost after max_attempts.
+    capacity is how many tasks run_graph keeps in flight across the cluster.
+    """
+    def __init__(self, address=('127.0.0.1', 0), authkey=None, capacity=16, max_attempts=3):
+        super().__init__('thread', max_workers=4)
+        self.capacity = capacity
+        self.max_attempts = max_attempts
+        self.authkey = authkey or os.urandom(16)
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        self.pending = queue.Queue() # job ids waiting for a worker
+        self.jobs = {} # job id -> Job
+        self.ids = count()
+        self.workers = {} # worker name -> stats
+        self.connections = []
+        self.lock = threading.Lock()
+        self.closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+    
+    def wants_process(self, task):
+        return not task.subscribers
+    
+    def submit_payload(self, payload):
+        job_id = next(self.ids)
+        job = self.jobs[job_id] = Job(payload)
+        self.pending.put(job_id)
+        return job.future
+    
+    def _requeue(self, job_id):
+        job = self.jobs[job_id]
+        job.attempts += 1
+        if job.attempts >= self.max_attempts:
+            del self.jobs[job_id]
+            job.future.set_exception(WorkerLost(f"job {job_id} lost its worker {job.attempts} times"))
+        else:
+            self.pending.put(job_id)
+    
+    def _accept(self):
+        while not self.closed:
+            try:
+                connection = self.listener.accept()
+            except Exception: # closed listener, failed handshake
+                if self.closed:
+                    return
+                continue
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+    
+    def _serve(self, connection):
+        """Feeds one worker up to its number of slots and collects its results."""
+        try:
+            _, name, slots = connection.recv() # ('hello', name, slots)
+        except (EOFError, OSError):
+            return
+        with self.lock:
+            self.connections.append(connection)
+            stats = self.workers[name] = {
+                'slots': slots, 'completed': 0, 'failed': 0, 'busy': 0.0,
+                'joined': time.time(), 'left': None, 'alive': True,
+            }
+        in_flight = set()
+        free_slots = threading.Semaphore(slots)
+        
+        def send_jobs():
+            while stats['alive'] and not self.closed:
+                if not free_slots.acquire(timeout=0.5):
+                    continue
+                try:
+                    job_id = self.pending.get(timeout=0.5)
+                except queue.Empty:
+                    free_slots.release()
+                    continue
+                with self.lock:
+                    if not stats['alive']: # lost while we waited, hand the job to someone else
+                        self._requeue(job_id)
+                        return
+                    in_flight.add(job_id)
+                try:
+                    connection.send(('run', job_id, self.jobs[job_id].payload))
+                except OSError:
+                    return # the receiving side notices and requeues
+        
+        threading.Thread(target=send_jobs, daemon=True).start()
+        try:
+            while True:
+                kind, job_id, body = connection.recv()
+                with self.lock:
+                    in_flight.discard(job_id)
+                    job = self.jobs.pop(job_id)
+                free_slots.release()
+                if kind == 'done':
+                    _, _, started, finished = body
+                    stats['completed'] += 1
+                    stats['busy'] += finished - started
+                    job.future.set_result(body)
+                else:
+                    stats['failed'] += 1
+                    job.future.set_exception(body)
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self.lock:
+                stats['alive'] = False
+                stats['left'] = time.time()
+                for job_id in in_flight:
+                    self._requeue(job_id)
+                in_flight.clear()
+            connection.close()
+    
+    def throughput(self):
+        """Per worker: tasks completed and failed, busy seconds, utilization and tasks per second."""
+        report = {}
+        with self.lock:
+            for name, stats in self.workers.items():
+                elapsed = (stats['left'] or time.time()) - stats['joined']
+                report[name] = dict(
+                    stats,
+                    tasks_per_sec=stats['completed'] / elapsed if elapsed else 0.0,
+                    utilization=stats['busy'] / (elapsed * stats['slots']) if elapsed else 0.0,
+                )
+        return report
+    
+    def shutdown(self, wait=True):
+        self.closed = True
+        with self.lock:
+            for connection in self.connections:
+                try:
+                    connection.send(('stop', None, None))
+                except OSError:
+                    pass
+        self.listener.close()
+        super().shutdown(wait=wait)
+
+
+def run_worker(address, authkey, slots=1, name=None):
+    """Worker side: connects to a coordinator and runs the tasks it sends until told to stop."""
+    name = name or f'{socket.gethostname()}-{os.getpid()}'
+    connection = Client(address, authkey=authkey)
+    connection.send(('hello', name, slots))
+    send_lock = threading.Lock()
+    
+    def run(job_id, payload):
+        try:
+            result, _, started, finished = run_pickled(payload, shared_outputs=False)
+            message = ('done', job_id, (result, name, started, finished))
+        except BaseException as error:
+            message = ('error', job_id, error)
+        with send_lock:
+            try:
+                connection.send(message)
+            except Exception as error: # unpicklable result or exception, nothing was written yet
+                try:
+                    connection.send(('error', job_id, RuntimeError(f"cannot send back the result: {error!r}")))
+                except Exception: # the coordinator is gone, it requeues the job
+                    pass
+    
+    with ThreadPoolExecutor(max_workers=slots) as pool:
+        while True:
+            try:
+                kind, job_id, payload = connection.recv()
+            except (EOFError, OSError):
+                break
+            if kind == 'stop':
+                break
+            pool.submit(run, job_id, payload)
+    connection.close()
+
+
+class LocalCluster(DistributedExecutor):
+    """
+    A coordinator and n_workers worker processes on this machine, standing in
+    for a multi-host deployment: same sockets, same protocol, same failure
+    handling (try kill_worker in the middle of a run).
+    """
+    def __init__(self, n_workers=2, slots=1, **kwargs):
+        kwargs.setdefault('capacity', n_workers * slots)
+        super().__init__(**kwargs)
+        self.worker_processes = [
+            Process(target=run_worker, args=(self.address, self.authkey, slots, f'local-{i}'), daemon=True)
+            for i in range(n_workers)
+        ]
+        for process in self.worker_processes:
+            process.start()
+    
+    def kill_worker(self, i):
+        self.worker_processes[i].kill()
+    
+    def shutdown(self, wait=True):
+        super().shutdown(wait=wait)
+        for process in self.worker_processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+
+
+
+
+
+
+
+
+
+##### TESTS #####
+
+
+from functools import partial
+import unittest
+
+from run import run_graph, run_in_thread
+from task import Binding, Task
+
+
+def square(x):
+    return x * x
+
+def total(*values):
+    return sum(values)
+
+def nap(seconds):
+    time.sleep(seconds)
+    return seconds
+
+unpicklable = lambda: None # pickled by name, which is '<lambda>'
+
+def return_unpicklable():
+    return unpicklable
+
+
+class TestLocalCluster(unittest.TestCase):
+    
+    def run_to_end(self, tasks, executor):
+        """Runs the graph off the test thread, so a hang fails the test instead of blocking it."""
+        future = run_in_thread(lambda: {name: output for output, name in run_graph(tasks, executor=executor, verbose=False)})
+        return future.result(timeout=30)
+    
+    def test_graph(self):
+        squares = [Task(partial(square, i), name=f'square{i}', ready=True) for i in range(6)]
+        summed = Task(total, name='total', fn_args=[Binding(task) for task in squares], yielder=True)
+        with LocalCluster(n_workers=2) as cluster:
+            self.assertEqual(self.run_to_end([*squares, summed], cluster), {'total': 55})
+            report = cluster.throughput()
+        self.assertEqual(sum(stats['completed'] for stats in report.values()), 7)
+    
+    def test_unpicklable_result_fails_the_task(self):
+        task = Task(return_unpicklable, name='unpicklable', ready=True, yielder=True)
+        with LocalCluster(n_workers=1) as cluster:
+            with self.assertRaises(RuntimeError):
+                self.run_to_end([task], cluster)
+    
+    def test_killed_worker_jobs_are_requeued(self):
+        naps = [Task(partial(nap, 0.5), name=f'nap{i}', ready=True, yielder=True) for i in range(2)]
+        with LocalCluster(n_workers=2) as cluster:
+            threading.Timer(0.25, cluster.kill_worker, [0]).start()
+            outputs = self.run_to_end(naps, cluster)
+            report = cluster.throughput()
+        self.assertEqual(outputs, {'nap0': 0.5, 'nap1': 0.5})
+        self.assertFalse(report['local-0']['alive'])
+        self.assertEqual(report['local-1']['completed'], 2)
+    
+    def test_worker_lost(self):
+        task = Task(partial(nap, 5), name='nap', ready=True, yielder=True)
+        with LocalCluster(n_workers=1, max_attempts=1) as cluster:
+            threading.Timer(0.5, cluster.kill_worker, [0]).start()
+            with self.assertRaises(WorkerLost):
+                self.run_to_end([task], cluster)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] and ':' in sys.argv[1]:
+        # python distributed.py HOST:PORT AUTHKEY_HEX [SLOTS]
+        host, port = sys.argv[1].rsplit(':', 1)
+        slots = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+        run_worker((host, int(port)), bytes.fromhex(sys.argv[2]), slots=slots)
+    else:
+        unittest.main()
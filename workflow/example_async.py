@@ -0,0 +1,32 @@
+from task import Task, Binding
+from run import arun_graph
+import asyncio
+import time
+
+
+def make_fetch(i):
+    async def fetch():
+        """Stands in for an HTTP call or a subprocess: only waits."""
+        await asyncio.sleep(1)
+        return f'page {i}'
+    return fetch
+
+def count_pages(*pages):
+    """A plain sync function, it runs on the executor."""
+    return f'{len(pages)} pages fetched'
+
+async def main():
+    fetchers = [Task(make_fetch(i), name=f'fetch_{i}', ready=True) for i in range(2000)]
+    counter = Task(
+        count_pages,
+        fn_args=[Binding(fetcher) for fetcher in fetchers],
+        yielder=True,
+    )
+    
+    start = time.time()
+    async for result, task_name in arun_graph(fetchers + [counter]):
+        print(f"Received final result from {task_name}: {result}")
+    print(f"2000 one-second waits took {time.time() - start:.2f}s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -44,16 +44,22 @@ compiler_design = Task(
     make_llm_fn('Ask me three questions about Compiler Design. Give only the questions, no answers, and say nothing else.'),
     ready=True,
     yielder=True,
+    timeout=120,
+    retries=2,
 )
 lisp = Task(
     make_llm_fn('Ask me three questions about Lisp language. Give only the questions, no answers, and say nothing else.'),
     ready=True,
     yielder=True,
+    timeout=120,
+    retries=2,
 )
 computer_scientists = Task(
     make_llm_fn('Tell me the biggest computer scientists of all time. Give only the names, and say nothing else.'),
     ready=True,
     yielder=True,
+    timeout=120,
+    retries=2,
 )
 
 final = Task(
@@ -12,8 +12,10 @@ def make_generate_data_stream(count):
     return generate_data_stream
 
 def process_data(data):
-    """Process the data received"""
-    return f"Processed: {data}"
+    """Process the data received, chunk by chunk, while it is still being generated"""
+    for chunk in data:
+        print(f"Processing {chunk}")
+        yield f"Processed: {chunk}\n"
 
 def main():
     # Create tasks
@@ -27,16 +29,16 @@ def main():
     process_task = Task(
         name="process_data",
         fn=process_data,
-        fn_args=[Binding(stream_task)],  # This task depends on stream_task
+        fn_args=[Binding(stream_task, stream=True, buffer_size=2)],  # Consumes stream_task's chunks as they come
         yielder=True,
     )
     
     # Run the graph and process streaming results
     for result, task_name in run_graph([stream_task, process_task]):
-        if ":partial" in task_name:
+        if task_name.endswith(":chunk"):
             print(f"Received partial result from {task_name.split(':')[0]}: {result}")
         else:
             print(f"Received final result from {task_name}: {result}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,5 +1,5 @@
 import re
-from task import Task, Binding, make_identity
+from task import Task, Binding, MapTask, make_identity
 from run import run_graph
 from tasteful import delegator
 from datetime import datetime
@@ -74,54 +74,55 @@ def clean_and_chunk_transcript(transcript):
     
     return d
 
-def merger(*args):
-    return '\n\n'.join(args)
+def merger(improved_chunks):
+    return '\n\n'.join(improved_chunks)
 
-def clean_separate_and_improve_transcript(*args):
-    """Clean, separate and improve a transcript"""
-    # Clean the transcript
-    # find occurances of [00:00] and replace with empty string, except the every 20th occurance
-    
-    raw_transcript = ''.join(args)
-    
-    print(f"Raw transcript: {raw_transcript}")
-    chunks = clean_and_chunk_transcript(raw_transcript)
-    
-    tasks = []
-    for k, v in chunks.items():
-        improver = Task(
-            make_llm_fn(
-                f"""take the following transcripts from youtube. convert it to meaningful paragraphs by coherent meanings. 
+def improve_chunk(chunk_text):
+    """Improves one chunk of transcript with the LLM"""
+    prompt = f"""take the following transcripts from youtube. convert it to meaningful paragraphs by coherent meanings. 
             and also correct punctuations and issues in it. Clean it. Be careful, always be very very loyal to the original text
             
             Never ever omit the text from original text!!! This is very very important!
 
             Below is the text:
             ```
-            {v}
+            {chunk_text}
             ```
             
             Always be very very loyal to the original text! Only output the cleaned and improved text! Say nothing else!"""
-            ),
-            ready=True,
-            yielder=True,
-        )
-        cleaned_timestamp = re.sub(r'\W+', '_', k)
-        improver.name = f"improver_{cleaned_timestamp}"
-        tasks.append(improver)
-        
+    return make_llm_fn(prompt)()
+
+def clean_separate_and_improve_transcript(*args):
+    """Clean, separate and improve a transcript"""
+    # Clean the transcript
+    # find occurances of [00:00] and replace with empty string, except the every 20th occurance
+    
+    raw_transcript = ''.join(args)
+    
+    print(f"Raw transcript: {raw_transcript}")
+    
+    chunker = Task(
+        lambda: clean_and_chunk_transcript(raw_transcript),
+        name='chunker',
+        postprocess=lambda chunks: list(chunks.values()),
+        ready=True,
+    )
+    # one task for all the chunks, each chunk is still its own executor job
+    improver = MapTask(
+        improve_chunk,
+        Binding(chunker),
+        batch_size=1,
+        name='improver',
+    )
     merger_task = Task(
         merger,
-        fn_args=[Binding(improver) for improver in tasks],
+        fn_args=[Binding(improver)],
         yielder=True,
     )
-    tasks.append(merger_task)
+    tasks = [chunker, improver, merger_task]
     
     for res, task_name in run_graph(tasks):
-        if task_name.startswith('improver'):
-            print(f"Received partial result from {task_name.split(':')[0]}: {res}")
-        else:
-            print(f"Received final result from {task_name}: {res}")
+        print(f"Received final result from {task_name}: {res}")
         print('-'*20+'\n\n')
 
 
@@ -0,0 +1,315 @@
+from collections.abc import Iterator
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import resource_tracker, shared_memory
+import os
+import pickle
+import threading
+import time
+
+
+# str/bytes outputs at least this large come back from worker processes
+# through shared memory instead of being pickled through the result pipe
+SHARED_MEMORY_THRESHOLD = 1 << 20
+
+
+def is_chunked(result):
+    """
+    Whether a task result is a stream of chunks (a generator or another iterator) rather than a value.
+    
+    Containers such as the lists a MapTask produces are values.
+    """
+    return isinstance(result, Iterator)
+
+
+class SharedOutput:
+    """Handle to a large output that a worker process left in shared memory."""
+    def __init__(self, name, size, is_text):
+        self.name = name
+        self.size = size
+        self.is_text = is_text
+    
+    @classmethod
+    def store(cls, data):
+        is_text = isinstance(data, str)
+        if is_text:
+            data = data.encode()
+        shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        shm.buf[:len(data)] = data
+        shm.close()
+        # ownership moves to the parent, which unlinks the segment in load()
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm.name, len(data), is_text)
+    
+    def load(self):
+        """Copies the output out of shared memory and frees the segment."""
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            data = bytes(shm.buf[:self.size])
+        finally:
+            shm.close()
+            shm.unlink()
+        return data.decode() if self.is_text else data
+
+
+def load_output(result):
+    """Turns what a worker returned into the task output."""
+    if isinstance(result, SharedOutput):
+        return result.load()
+    return result
+
+
+def apply_batch(fn, batch):
+    """Runs fn over one batch of a MapTask's items. Module level, so it pickles."""
+    return [fn(item) for item in batch]
+
+
+def timed(task, runner, on_run):
+    """Wraps a runner to report (task, worker, started, finished) to on_run from the thread it runs on."""
+    def timed_runner():
+        started = time.time()
+        try:
+            return runner()
+        finally:
+            on_run(task, threading.current_thread().name, started, time.time())
+    return timed_runner
+
+
+def submit_attempts(task, submit_attempt, hedge_after=None):
+    """
+    Runs a task through submit_attempt(), a callable returning a Future, with
+    its timeout, retries and hedging. Returns a Future of the first attempt
+    that succeeds.
+    
+    An attempt taking longer than task.timeout counts as failed with a
+    TimeoutError. Threads and worker processes cannot be interrupted, so the
+    attempt is abandoned rather than killed: it keeps its worker until it
+    returns, then its result is dropped (and its shared memory freed). Timers
+    are cancelled as soon as they are moot. A failed attempt is retried up to
+    task.retries times, waiting task.backoff seconds, doubled on each retry.
+    
+    With hedge_after, usually a percentile of the task's past durations, a
+    duplicate attempt starts once the first one has run that long, and the
+    earlier of the two to succeed wins. Only use it for tasks that are safe
+    to run twice. Tasks feeding streaming bindings are neither retried nor
+    hedged, since their chunks have already been pushed downstream.
+    """
+    retries = 0 if task.subscribers else task.retries
+    if task.subscribers:
+        hedge_after = None
+    if not task.timeout and not retries and hedge_after is None:
+        return submit_attempt()
+    
+    future = Future()
+    lock = threading.Lock()
+    settled = set() # attempts whose outcome was already counted
+    timeouts = {} # attempt -> its timeout timer, cancelled once it is settled
+    hedges = [] # hedge timers, cancelled once the task is done
+    live = [0] # attempts in flight
+    failures = [0]
+    
+    def later(delay, fn, *args):
+        timer = threading.Timer(delay, fn, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+    
+    def launch(hedging=False):
+        with lock:
+            if future.done():
+                return
+            live[0] += 1
+        attempt = submit_attempt()
+        with lock:
+            if task.timeout:
+                timeouts[attempt] = later(task.timeout, expire, attempt)
+            if hedge_after is not None and not hedging:
+                hedges.append(later(hedge_after, launch, True))
+        attempt.add_done_callback(settle)
+    
+    def expire(attempt):
+        settle(attempt, TimeoutError(f"{task.name} did not finish within {task.timeout}s"))
+        attempt.cancel() # frees its worker only if it is still queued
+    
+    def discard(attempt):
+        """Frees what an attempt that lost or timed out returned, such as a shared memory segment."""
+        if not attempt.cancelled() and attempt.exception() is None:
+            load_output(attempt.result())
+    
+    def settle(attempt, error=None):
+        with lock:
+            timer = timeouts.pop(attempt, None)
+            if timer is not None:
+                timer.cancel()
+            abandoned = attempt in settled or future.done()
+            if abandoned:
+                if error is not None: # its timeout fired after its outcome was counted
+                    return
+            else: # its first outcome: finished, failed or timed out
+                settled.add(attempt)
+                live[0] -= 1
+                if error is None:
+                    error = CancelledError() if attempt.cancelled() else attempt.exception()
+                if error is None:
+                    future.set_result(attempt.result())
+                elif live[0]: # a hedged attempt may still succeed
+                    return
+                else:
+                    failures[0] += 1
+                    if failures[0] > retries:
+                        future.set_exception(error)
+                if future.done():
+                    for timer in hedges:
+                        timer.cancel()
+                    return
+        if abandoned: # it finished after timing out or losing to a hedge
+            discard(attempt)
+            return
+        later(task.backoff * 2 ** (failures[0] - 1), launch)
+    
+    launch()
+    return future
+
+
+def run_pickled(payload, shared_outputs=True):
+    """
+    Entry point in a worker process: unpickles the call, runs it, ships the result back.
+    
+    Returns (result, worker, started, finished) so the parent can trace the run.
+    shared_outputs=False for workers on another host, which shares no memory.
+    """
+    started = time.time()
+    fn, args, kwargs = pickle.loads(payload)
+    result = fn(*args, **kwargs)
+    if is_chunked(result): # generators cannot cross the process boundary
+        result = ''.join(result)
+    if shared_outputs and isinstance(result, (str, bytes)) and len(result) >= SHARED_MEMORY_THRESHOLD:
+        result = SharedOutput.store(result)
+    return result, f'process-{os.getpid()}', started, time.time()
+
+
+class GraphExecutor:
+    """
+    Runs task runners on threads, in worker processes, or both.
+    
+    Modes:
+    - 'thread': every task on a thread pool
+    - 'process': every task in a process pool
+    - 'hybrid': tasks declared with cpu_bound=True in the process pool, the rest on threads
+    
+    Tasks that feed streaming bindings always run on threads, since their chunks
+    are pushed into in-process channels. Tasks whose function or arguments cannot
+    be pickled fall back to threads as well.
+    """
+    MODES = ('thread', 'process', 'hybrid')
+    
+    def __init__(self, mode='thread', max_workers=10, max_processes=None):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown executor mode {mode!r}, expected one of {self.MODES}")
+        self.mode = mode
+        self.threads = ThreadPoolExecutor(max_workers=max_workers)
+        self.processes = None
+        self.capacity = max_workers # how many tasks can run at once
+        if mode != 'thread':
+            max_processes = max_processes or os.cpu_count() or 1
+            self.processes = ProcessPoolExecutor(max_workers=max_processes)
+            self.capacity += max_processes
+    
+    def wants_process(self, task):
+        if self.mode == 'thread' or task.subscribers:
+            return False
+        return self.mode == 'process' or task.cpu_bound
+    
+    def submit(self, task, runner, on_run=None, call=None):
+        """
+        Submits a task whose bindings are resolved. Returns a Future of its raw result.
+        
+        on_run(task, worker, started, finished) is called once the task has run.
+        call is the (fn, args, kwargs) a worker process runs, if not the task's own.
+        """
+        if self.wants_process(task):
+            try:
+                payload = pickle.dumps(call or (task.fn, task.fn_args, task.fn_kwargs))
+            except (pickle.PicklingError, AttributeError, TypeError) as error:
+                print(f'{task.name} cannot be shipped to a worker process ({error}), running it on a thread')
+            else:
+                return self._unwrap(task, self.submit_payload(payload), on_run)
+        if on_run:
+            runner = timed(task, runner, on_run)
+        return self.threads.submit(runner)
+    
+    def submit_payload(self, payload):
+        """Sends a pickled call to a worker process. Returns a Future of run_pickled's report."""
+        return self.processes.submit(run_pickled, payload)
+    
+    def map(self, task, items, on_run=None):
+        """
+        Runs a MapTask's fn over items, task.batch_size items per submission.
+        
+        Returns a single Future of all the results, in the order of items.
+        """
+        batches = [items[i:i + task.batch_size] for i in range(0, len(items), task.batch_size)]
+        future = Future()
+        if not batches:
+            future.set_result([])
+            return future
+        results = [None] * len(batches)
+        remaining = [len(batches)]
+        lock = threading.Lock()
+        
+        def done(i, batch_future):
+            if future.done(): # an earlier batch failed
+                return
+            try:
+                results[i] = batch_future.result()
+            except BaseException as error:
+                with lock:
+                    if not future.done():
+                        future.set_exception(error)
+                return
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    future.set_result([result for batch in results for result in batch])
+        
+        for i, batch in enumerate(batches):
+            batch_future = self.submit(
+                task, partial(apply_batch, task.fn, batch), on_run, call=(apply_batch, (task.fn, batch), {}),
+            )
+            batch_future.add_done_callback(partial(done, i))
+        return future
+    
+    @staticmethod
+    def _unwrap(task, process_future, on_run):
+        """Chains a future of the bare result onto a future of run_pickled's report."""
+        future = Future()
+        def done(process_future):
+            try:
+                result, worker, started, finished = process_future.result()
+            except BaseException as error:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(error)
+                return
+            if on_run:
+                on_run(task, worker, started, finished)
+            if not future.set_running_or_notify_cancel(): # abandoned, see submit_attempts
+                load_output(result)
+                return
+            future.set_result(result)
+        def cancelled(_):
+            if future.cancelled():
+                process_future.cancel() # frees its worker only if it is still queued
+        future.add_done_callback(cancelled)
+        process_future.add_done_callback(done)
+        return future
+    
+    def shutdown(self, wait=True):
+        self.threads.shutdown(wait=wait)
+        if self.processes:
+            self.processes.shutdown(wait=wait)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.shutdown()
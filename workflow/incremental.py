@@ -0,0 +1,129 @@
+import hashlib
+import pickle
+import sqlite3
+
+from cache import canonical, stable_bytes
+
+
+def compute_task_keys(tasks):
+    """
+    Gives every task a key that changes whenever the task or anything upstream of it changes.
+    
+    A key hashes the task's function and postprocess identity, its bindings'
+    transformers, and the keys of its sources (like a Merkle tree), so a
+    changed root dirties exactly its transitive dependents. Must run before
+    bindings are resolved, on a graph without cycles.
+    
+    A task whose identity cannot be pickled, say a closure over an open
+    connection, gets None, and so does everything downstream of it: those
+    tasks are always rerun.
+    """
+    keys = {}
+    for root in tasks:
+        stack = [root] # iterative post-order, deep chains must not hit the recursion limit
+        while stack:
+            task = stack[-1]
+            if task in keys:
+                stack.pop()
+                continue
+            bindings = list(enumerate(task.fn_args)) + list(task.fn_kwargs.items())
+            missing = [binding.source for _, binding in bindings if binding.source not in keys]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            if any(keys[b.source] is None for _, b in bindings):
+                keys[task] = None
+                continue
+            identity = (
+                canonical(task.fn),
+                canonical(task.postprocess),
+                [(slot, canonical(b.transformer), b.stream, keys[b.source]) for slot, b in bindings],
+            )
+            data = stable_bytes(identity)
+            keys[task] = None if data is None else hashlib.sha256(data).hexdigest()
+    return keys
+
+
+class RunState:
+    """
+    Outputs of previous runs, by task name, along with the key that produced them.
+    
+    Pass the same RunState to successive run_graph calls: tasks whose key has
+    not changed since it was recorded are completed with the recorded output
+    instead of being run again.
+    
+    With a path, every recorded output is also committed to a sqlite file as
+    soon as its task completes, and loaded back when the file is opened
+    again, so a run that dies can be resumed by another process.
+    """
+    def __init__(self, path=None):
+        self.entries = {} # name -> (key, output before postprocess)
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL') # cheap commits, one per completed task
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS outputs (name TEXT PRIMARY KEY, key TEXT, output BLOB)')
+            self._db.commit()
+            for name, key, blob in self._db.execute('SELECT name, key, output FROM outputs'):
+                self.entries[name] = (key, pickle.loads(blob))
+    
+    def lookup(self, name, key):
+        """Returns (True, output) if name was recorded with the same key, else (False, None)."""
+        entry = self.entries.get(name)
+        if entry is None or entry[0] != key:
+            return False, None
+        return True, entry[1]
+    
+    def record(self, name, key, output):
+        if key is None: # not reusable, see compute_task_keys
+            return
+        self.entries[name] = (key, output)
+        if self._db is None:
+            return
+        try:
+            blob = pickle.dumps(output)
+        except Exception: # not checkpointable, rerun on resume
+            return
+        self._db.execute('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?)', (name, key, blob))
+        self._db.commit()
+    
+    def clear(self):
+        self.entries.clear()
+        if self._db is not None:
+            self._db.execute('DELETE FROM outputs')
+            self._db.commit()
+
+
+def open_state(state, checkpoint, resume):
+    """The RunState a run records into, given the state/checkpoint/resume arguments of run_graph."""
+    if checkpoint is None:
+        return state
+    if state is not None:
+        raise ValueError("pass either state or checkpoint, not both")
+    state = RunState(checkpoint)
+    if not resume:
+        state.clear()
+    return state
+
+
+def reuse_previous_outputs(tasks, state):
+    """
+    Completes the clean tasks of the graph from state.
+    
+    Returns (keys, reused): the key of every task, for recording the tasks
+    that do run, and the list of tasks that were completed from state.
+    """
+    keys = compute_task_keys(tasks)
+    reused = []
+    for task, key in keys.items():
+        if task.completed or key is None:
+            continue
+        found, output = state.lookup(task.name, key)
+        if found:
+            task.output = output
+            task.completed = True
+            task.ready = True
+            reused.append(task)
+    return keys, reused
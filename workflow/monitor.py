@@ -1,3 +1,8 @@
+import json
+import sys
+import threading
+import time
+
 
 def print_task_graph_summary(tasks):
     """
@@ -112,4 +117,180 @@ def print_task_graph_summary(tasks):
     for i, path in enumerate(all_execution_paths, 1):
         print(f"  Path {i}: {' → '.join(path)}")
     
-    print("\n=== END OF SUMMARY ===")
\ No newline at end of file
+    print("\n=== END OF SUMMARY ===")
+
+
+class RunTracer:
+    """
+    Records where the wall-clock time of a run_graph call goes, per task.
+    
+    For every task: when it became ready, when it was submitted, when it
+    started and finished on which worker, its queue wait (ready to start) and
+    the size of its output. Pass one to run_graph(tracer=...), then look at
+    report(), print_run_report() or open to_chrome_trace() in chrome://tracing
+    or https://ui.perfetto.dev.
+    """
+    def __init__(self):
+        self.records = {} # task -> dict of timings; names may repeat, e.g. unnamed tasks of the same function
+        self._lock = threading.Lock()
+    
+    def _get(self, task):
+        """The record of a task, created on first use. Call with the lock held."""
+        return self.records.setdefault(task, {'name': task.name})
+    
+    def _record(self, task, **fields):
+        with self._lock:
+            self._get(task).update(fields)
+    
+    def ready(self, task):
+        self._record(task, ready=time.time())
+    
+    def submitted(self, task):
+        self._record(task, submitted=time.time())
+    
+    def ran(self, task, worker, started, finished):
+        """Called once per run; a MapTask runs once per batch and spans all of them."""
+        with self._lock:
+            record = self._get(task)
+            record['worker'] = worker
+            record['started'] = min(started, record.get('started', started))
+            record['finished'] = max(finished, record.get('finished', finished))
+    
+    def completed(self, task, output):
+        now = time.time()
+        size = len(output) if hasattr(output, '__len__') else sys.getsizeof(output)
+        with self._lock:
+            record = self._get(task)
+            record.setdefault('worker', 'cache') # completed without running anywhere
+            record.setdefault('started', now)
+            record.setdefault('finished', now)
+            record.update(completed=now, output_size=size)
+    
+    def report(self):
+        """Structured summary of the run: per-task timings and per-worker utilization."""
+        records = [dict(r) for r in self.records.values() if 'completed' in r]
+        if not records:
+            return {'makespan': 0, 'tasks': [], 'workers': {}}
+        origin = min(r.get('ready', r['started']) for r in records)
+        makespan = max(r['completed'] for r in records) - origin
+        workers = {}
+        for r in records:
+            r['queue_wait'] = r['started'] - r.get('ready', r.get('submitted', r['started']))
+            r['duration'] = r['finished'] - r['started']
+            worker = workers.setdefault(r['worker'], {'tasks': 0, 'busy': 0.0})
+            worker['tasks'] += 1
+            worker['busy'] += r['duration']
+        for worker in workers.values():
+            worker['utilization'] = worker['busy'] / makespan if makespan else 0.0
+        records.sort(key=lambda r: r['started'])
+        return {'makespan': makespan, 'tasks': records, 'workers': workers}
+    
+    def to_chrome_trace(self, path=None):
+        """Trace Event Format (one complete event per task, one track per worker). Written to path if given."""
+        report = self.report()
+        tids = {worker: tid for tid, worker in enumerate(sorted(report['workers']), 1)}
+        origin = min((r['started'] for r in report['tasks']), default=0)
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': worker}}
+            for worker, tid in tids.items()
+        ]
+        for r in report['tasks']:
+            events.append({
+                'name': r['name'],
+                'ph': 'X',
+                'pid': 1,
+                'tid': tids[r['worker']],
+                'ts': (r['started'] - origin) * 1e6,
+                'dur': r['duration'] * 1e6,
+                'args': {'queue_wait_ms': r['queue_wait'] * 1e3, 'output_size': r['output_size']},
+            })
+        trace = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        if path:
+            with open(path, 'w') as f:
+                json.dump(trace, f)
+        return trace
+
+
+def print_run_report(tracer, slowest=10):
+    """Prints the makespan, worker utilization and the slowest tasks of a traced run."""
+    report = tracer.report()
+    print("=== RUN REPORT ===\n")
+    print(f"Makespan: {report['makespan']:.3f}s, {len(report['tasks'])} tasks\n")
+    
+    print("Workers:")
+    for worker, stats in sorted(report['workers'].items()):
+        print(f"  {worker}: {stats['tasks']} tasks, busy {stats['busy']:.3f}s ({stats['utilization']:.0%})")
+    
+    print("\nSlowest Tasks:")
+    for r in sorted(report['tasks'], key=lambda r: r['duration'], reverse=True)[:slowest]:
+        print(f"  {r['name']}: ran {r['duration']:.3f}s on {r['worker']}, waited {r['queue_wait']:.3f}s, output size {r['output_size']}")
+    
+    print("\n=== END OF REPORT ===")
+
+
+
+
+
+
+
+
+
+
+##### TESTS #####
+
+
+import unittest
+
+from task import Binding, Task
+
+
+class TestRunTracer(unittest.TestCase):
+    
+    def run_graph(self, tasks, **kwargs):
+        from run import run_graph # run imports this module
+        return list(run_graph(tasks, verbose=False, **kwargs))
+    
+    def test_tasks_sharing_a_name(self):
+        def work(*_):
+            time.sleep(0.02)
+            return 'ab'
+        roots = [Task(work, ready=True) for _ in range(4)] # all named 'work'
+        sink = Task(work, fn_args=[Binding(root) for root in roots], yielder=True)
+        tracer = RunTracer()
+        
+        self.run_graph([*roots, sink], max_workers=2, tracer=tracer)
+        report = tracer.report()
+        
+        self.assertEqual(len(report['tasks']), 5)
+        self.assertEqual([r['name'] for r in report['tasks']], ['work'] * 5)
+        self.assertEqual(sum(w['tasks'] for w in report['workers'].values()), 5)
+        self.assertGreaterEqual(sum(w['busy'] for w in report['workers'].values()), 5 * 0.02)
+        self.assertLessEqual(len(report['workers']), 2)
+        for r in report['tasks']:
+            self.assertEqual(r['output_size'], 2)
+            self.assertGreaterEqual(r['queue_wait'], 0)
+            self.assertLessEqual(r['started'], r['finished'])
+        self.assertGreaterEqual(report['tasks'][-1]['started'], max(r['finished'] for r in report['tasks'][:-1]))
+        self.assertGreaterEqual(report['makespan'], 3 * 0.02) # two waves of roots, then the sink
+    
+    def test_chrome_trace(self):
+        first = Task(lambda: 'x', name='first', ready=True)
+        second = Task(lambda x: x * 3, name='second', fn_args=[Binding(first)], yielder=True)
+        tracer = RunTracer()
+        self.run_graph([first, second], tracer=tracer)
+        
+        trace = tracer.to_chrome_trace()
+        
+        tracks = {e['tid']: e['args']['name'] for e in trace['traceEvents'] if e['ph'] == 'M'}
+        spans = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual(sorted(e['name'] for e in spans), ['first', 'second'])
+        for e in spans:
+            self.assertIn(e['tid'], tracks)
+            self.assertGreaterEqual(e['ts'], 0)
+            self.assertGreaterEqual(e['dur'], 0)
+        self.assertEqual({e['name']: e['args']['output_size'] for e in spans}, {'first': 1, 'second': 3})
+        json.dumps(trace)
+
+
+if __name__ == '__main__':
+    unittest.main()
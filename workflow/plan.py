@@ -0,0 +1,286 @@
+from collections import Counter, deque
+from functools import partial
+import queue
+
+from cycle_detector import detect_circular_dependencies
+from executors import GraphExecutor, apply_batch, is_chunked, load_output, submit_attempts
+from task import MapTask
+
+
+def call_node(fn, args, kwargs):
+    """Runs one node of a plan on a worker, draining chunked results like make_runner does."""
+    result = fn(*args, **kwargs)
+    if is_chunked(result):
+        result = ''.join(result)
+    return result
+
+
+class ExecutionPlan:
+    """
+    A task graph flattened by compile_graph into arrays indexed by node id.
+    
+    - tasks, names: the Task and its name for every node, in topological order
+    - levels: node ids grouped by depth; every node only depends on earlier levels
+    - offsets, targets: the dependents of node i are targets[offsets[i]:offsets[i + 1]]
+    - indegree: number of distinct sources of every node
+    - args, kwargs: per node, (source id, transformer) pairs that resolve its bindings
+    - roots: name -> node ids of the tasks without sources
+    
+    run() only copies indegree and walks these arrays, so running the same plan
+    over and over costs close to nothing beyond the tasks themselves. The Task
+    objects are read at compile time and never modified.
+    """
+    def __init__(self, tasks, levels, offsets, targets, indegree, args, kwargs, mode='thread', max_workers=10, max_processes=None):
+        self.tasks = tasks
+        self.names = [task.name for task in tasks]
+        self.levels = levels
+        self.offsets = offsets
+        self.targets = targets
+        self.indegree = indegree
+        self.args = args
+        self.kwargs = kwargs
+        self.roots = {}
+        for i, task in enumerate(tasks):
+            if not indegree[i]:
+                self.roots.setdefault(task.name, []).append(i)
+        self.yielders = [i for i, task in enumerate(tasks) if task.yielder]
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_processes = max_processes
+        self.executor = None # created on the first run, reused by the next ones
+    
+    def __len__(self):
+        return len(self.tasks)
+    
+    def resolve(self, i, outputs):
+        """(fn, args, kwargs) of node i, with its bindings resolved against outputs."""
+        args = [transformer(outputs[source]) for source, transformer in self.args[i]]
+        kwargs = {key: transformer(outputs[source]) for key, source, transformer in self.kwargs[i]}
+        if isinstance(self.tasks[i], MapTask):
+            args = [list(args[0])]
+        return self.tasks[i].fn, args, kwargs
+    
+    def run(self, inputs=None, executor=None):
+        """
+        Runs the plan once and returns {name: output} of its yielder tasks.
+        
+        inputs maps root task names to outputs to use instead of running
+        those roots; a name shared by several roots is ambiguous and
+        rejected. Tasks run on executor if given, else on an executor the
+        plan keeps between runs; with mode='inline' they run one after the
+        other on the calling thread, which is the fastest for small graphs.
+        """
+        outputs = [None] * len(self.tasks)
+        remaining = self.indegree.copy()
+        ready = deque()
+        
+        def release(i):
+            for j in self.targets[self.offsets[i]:self.offsets[i + 1]]:
+                remaining[j] -= 1
+                if remaining[j] == 0:
+                    ready.append(j)
+        
+        def complete(i, output):
+            outputs[i] = self.tasks[i].postprocess(output)
+            release(i)
+        
+        given = {}
+        for name, value in (inputs or {}).items():
+            if name not in self.roots:
+                raise ValueError(f"{name!r} is not a root task of this plan, roots are {sorted(self.roots)}")
+            if len(self.roots[name]) > 1:
+                raise ValueError(f"{len(self.roots[name])} root tasks are named {name!r}, name them apart to give them inputs")
+            given[self.roots[name][0]] = value
+        ready.extend(i for i, n in enumerate(self.indegree) if not n and i not in given)
+        for i, value in given.items():
+            outputs[i] = value
+            release(i)
+        
+        if executor is None and self.mode == 'inline':
+            while ready:
+                i = ready.popleft()
+                fn, args, kwargs = self.resolve(i, outputs)
+                complete(i, apply_batch(fn, args[0]) if isinstance(self.tasks[i], MapTask) else call_node(fn, args, kwargs))
+            return {self.names[i]: outputs[i] for i in self.yielders}
+        
+        if executor is None:
+            if self.executor is None:
+                self.executor = GraphExecutor(self.mode, max_workers=self.max_workers, max_processes=self.max_processes)
+            executor = self.executor
+        events = queue.SimpleQueue()
+        
+        def on_done(i, future):
+            events.put((i, future))
+        
+        pending = 0
+        while ready or pending:
+            while ready:
+                i = ready.popleft()
+                task = self.tasks[i]
+                fn, args, kwargs = call = self.resolve(i, outputs)
+                if isinstance(task, MapTask):
+                    submit_attempt = partial(executor.map, task, args[0])
+                else:
+                    submit_attempt = partial(executor.submit, task, partial(call_node, *call), call=call)
+                future = submit_attempts(task, submit_attempt)
+                future.add_done_callback(partial(on_done, i))
+                pending += 1
+            i, future = events.get()
+            pending -= 1
+            complete(i, load_output(future.result()))
+        return {self.names[i]: outputs[i] for i in self.yielders}
+    
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def compile_graph(tasks, mode='thread', max_workers=10, max_processes=None):
+    """
+    Validates a task graph once and compiles it into an ExecutionPlan.
+    
+    Use it instead of run_graph for a graph shape that runs many times with
+    different root inputs: cycle detection, dependency discovery and binding
+    lookups happen here, not on every run. Sources missing from tasks are
+    added. Streaming bindings are compiled as regular bindings, and caching,
+    incremental state, policies and tracing are left to run_graph. Compile
+    tasks before running them anywhere else: run_graph replaces their bindings
+    with the resolved values.
+    
+    mode is a GraphExecutor mode, or 'inline' to run on the calling thread.
+    Yielder tasks must have distinct names, they key the results of run().
+    """
+    detect_circular_dependencies(tasks)
+    
+    # Every task reachable through bindings, deduplicated, in first-seen order
+    found = dict.fromkeys(tasks)
+    stack = list(found)
+    while stack:
+        task = stack.pop()
+        for binding in (*task.fn_args, *task.fn_kwargs.values()):
+            if binding.source not in found:
+                found[binding.source] = None
+                stack.append(binding.source)
+    
+    sources = {task: list(dict.fromkeys(b.source for b in (*task.fn_args, *task.fn_kwargs.values()))) for task in found}
+    
+    # Kahn's algorithm, one level at a time
+    dependents = {task: [] for task in found}
+    for task, task_sources in sources.items():
+        for source in task_sources:
+            dependents[source].append(task)
+    indegree = {task: len(task_sources) for task, task_sources in sources.items()}
+    level = [task for task in found if not indegree[task]]
+    levels = []
+    while level:
+        levels.append(level)
+        next_level = []
+        for task in level:
+            for dependent in dependents[task]:
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    next_level.append(dependent)
+        level = next_level
+    
+    order = [task for level in levels for task in level]
+    yielder_names = Counter(task.name for task in order if task.yielder)
+    duplicates = sorted(name for name, count in yielder_names.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"yielder tasks share the names {duplicates}, name them apart")
+    ids = {task: i for i, task in enumerate(order)}
+    offsets, targets = [0], []
+    for task in order:
+        targets.extend(ids[dependent] for dependent in dependents[task])
+        offsets.append(len(targets))
+    return ExecutionPlan(
+        tasks=order,
+        levels=[[ids[task] for task in level] for level in levels],
+        offsets=offsets,
+        targets=targets,
+        indegree=[len(sources[task]) for task in order],
+        args=[tuple((ids[b.source], b.transformer) for b in task.fn_args) for task in order],
+        kwargs=[tuple((key, ids[b.source], b.transformer) for key, b in task.fn_kwargs.items()) for task in order],
+        mode=mode,
+        max_workers=max_workers,
+        max_processes=max_processes,
+    )
+
+
+
+
+
+
+
+
+
+
+##### TESTS #####
+
+
+import unittest
+
+from task import Binding, Task
+
+
+class TestExecutionPlan(unittest.TestCase):
+    
+    def build(self, calls):
+        def record(name, value):
+            calls.append(name)
+            return value
+        a = Task(lambda: record('a', 1), name='a', ready=True)
+        b = Task(lambda: record('b', 2), name='b', ready=True)
+        total = Task(lambda x, y: record('total', x + y), name='total', fn_args=[Binding(a), Binding(b)], yielder=True)
+        double = Task(lambda x: record('double', 2 * x), name='double', fn_args=[Binding(total)], yielder=True)
+        return [a, b, total, double]
+    
+    def test_levels(self):
+        plan = compile_graph(self.build([]), mode='inline')
+        self.assertEqual([[plan.names[i] for i in level] for level in plan.levels], [['a', 'b'], ['total'], ['double']])
+    
+    def test_modes_and_repeated_runs(self):
+        for mode in ('inline', 'thread'):
+            calls = []
+            with compile_graph(self.build(calls), mode=mode) as plan:
+                for _ in range(3):
+                    self.assertEqual(plan.run(), {'total': 3, 'double': 6})
+            self.assertEqual(sorted(calls), sorted(['a', 'b', 'total', 'double'] * 3))
+    
+    def test_inputs_replace_roots(self):
+        for mode in ('inline', 'thread'):
+            calls = []
+            with compile_graph(self.build(calls), mode=mode) as plan:
+                self.assertEqual(plan.run({'a': 10}), {'total': 12, 'double': 24})
+                self.assertEqual(plan.run({'a': 20, 'b': 0}), {'total': 20, 'double': 40})
+                self.assertEqual(plan.run(), {'total': 3, 'double': 6})
+                with self.assertRaises(ValueError):
+                    plan.run({'total': 0})
+            self.assertEqual(calls.count('a'), 1)
+            self.assertEqual(calls.count('b'), 2)
+    
+    def test_roots_sharing_a_name(self):
+        for mode in ('inline', 'thread'):
+            first = Task(lambda: 'x', ready=True) # both named <lambda>
+            second = Task(lambda: 'y', ready=True)
+            merged = Task(lambda x, y: x + y, name='m', fn_args=[Binding(first), Binding(second)], yielder=True)
+            with compile_graph([first, second, merged], mode=mode) as plan:
+                self.assertEqual(plan.run(), {'m': 'xy'})
+                with self.assertRaises(ValueError):
+                    plan.run({'<lambda>': 'z'})
+    
+    def test_yielders_sharing_a_name(self):
+        source = Task(lambda: 1, name='source', ready=True)
+        sinks = [Task(lambda x: x, name='sink', fn_args=[Binding(source)], yielder=True) for _ in range(2)]
+        with self.assertRaises(ValueError):
+            compile_graph([source, *sinks])
+
+
+if __name__ == '__main__':
+    unittest.main()
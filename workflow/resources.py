@@ -0,0 +1,90 @@
+from collections import defaultdict
+import time
+
+
+class TokenBucket:
+    """Allows rate admissions per second on average, and bursts of up to burst at once."""
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+    
+    def available(self):
+        self._refill()
+        return self.tokens >= 1
+    
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+    
+    def wait_time(self):
+        """Seconds until a token is available."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class ResourceManager:
+    """
+    Tracks what the running tasks hold, to admit a task only when what it declares is free.
+    
+    A task declares Task.resources, a dict of resource name -> amount, and
+    Task.memory, an estimate in bytes. Named resources are capped by limits
+    (names without a limit are unlimited), each admission of a task declaring
+    a name with a TokenBucket in rate_limits takes one token, and the sum of
+    the memory estimates of running tasks stays under memory_limit.
+    """
+    def __init__(self, limits=None, rate_limits=None, memory_limit=None):
+        self.limits = dict(limits or {})
+        self.rate_limits = dict(rate_limits or {})
+        self.memory_limit = memory_limit
+        self.in_use = defaultdict(int)
+        self.memory_in_use = 0
+    
+    def check(self, task):
+        """Raises ValueError for a task that could never be admitted."""
+        for name, amount in task.resources.items():
+            if name in self.limits and amount > self.limits[name]:
+                raise ValueError(f"{task.name} needs {amount} of {name!r} but only {self.limits[name]} exist")
+        if self.memory_limit is not None and task.memory > self.memory_limit:
+            raise ValueError(f"{task.name} needs {task.memory} bytes of memory, over the {self.memory_limit} limit")
+    
+    def blocker(self, task):
+        """
+        What keeps the task from being admitted now, or None if nothing does.
+        
+        A resource name, 'memory', or ('rate', name) for a rate limit.
+        """
+        for name, amount in task.resources.items():
+            if name in self.limits and self.in_use[name] + amount > self.limits[name]:
+                return name
+        if self.memory_limit is not None and self.memory_in_use + task.memory > self.memory_limit:
+            return 'memory'
+        for name in task.resources:
+            bucket = self.rate_limits.get(name)
+            if bucket and not bucket.available():
+                return ('rate', name)
+        return None
+    
+    def acquire(self, task):
+        for name, amount in task.resources.items():
+            self.in_use[name] += amount
+            if name in self.rate_limits:
+                self.rate_limits[name].take()
+        self.memory_in_use += task.memory
+    
+    def release(self, task):
+        """Gives back what the task held. Returns the blockers that may have cleared."""
+        for name, amount in task.resources.items():
+            self.in_use[name] -= amount
+        self.memory_in_use -= task.memory
+        return list(task.resources) + (['memory'] if task.memory else [])
+    
+    def wait_time(self, blocker):
+        """Seconds until a rate limit blocker clears."""
+        return self.rate_limits[blocker[1]].wait_time()
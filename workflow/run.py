@@ -3,71 +3,768 @@ import sys
 sys.path.append(str(Path(__file__).parent.parent))
 
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from utils import flatten
+from concurrent.futures import Future
+from functools import partial
+import asyncio
+import inspect
+import itertools
+import queue
+import threading
+import time
 
+from cache import MISS
+from executors import GraphExecutor, is_chunked, load_output, submit_attempts, timed
+from incremental import open_state, reuse_previous_outputs
+from scheduling import FifoPolicy, ReadyQueue
+from task import Binding, MapTask
 from monitor import print_task_graph_summary
 from cycle_detector import detect_circular_dependencies
   
 
-def mark_tasks_whose_dependencies_are_satisfied_as_ready(tasks):
-    """Marks tasks whose dependencies are satisfied as ready."""
-    for task in tasks:
-        if task.ready:
+def build_dependency_graph(tasks, streaming=True):
+    """
+    Builds the reverse edges and indegree counters of the task graph once.
+    
+    Streaming bindings are subscribed here, before anything runs, so no chunk
+    is missed. They do not count towards the indegree: a streaming consumer
+    starts as soon as its other sources are completed. If one of those waits
+    for the producer to complete, the channel is unbounded, since nothing
+    reads it before the producer is done. With streaming=False
+    they are treated as regular bindings. Sources missing from tasks are
+    added, so they run too.
+    
+    Returns:
+        dependents: task -> list of tasks that bind to its output
+        indegree: task -> number of distinct sources not yet completed
+    """
+    dependents = {task: [] for task in tasks}
+    indegree = {}
+    order = list(dependents) # the same task may be listed more than once
+    for task in order:
+        bindings = task.fn_args + list(task.fn_kwargs.values())
+        for binding in bindings:
+            if streaming and binding.stream and not binding.source.completed:
+                binding.subscribe(bounded=not waits_for(task, binding.source))
+        sources = dict.fromkeys(b.source for b in bindings if b.channel is None) # dedup, keep order
+        pending = [source for source in sources if not source.completed]
+        indegree[task] = len(pending)
+        for source in pending:
+            if source not in dependents:
+                dependents[source] = []
+                order.append(source)
+            dependents[source].append(task)
+    return dependents, indegree
+
+def waits_for(task, producer):
+    """Whether task can only start once producer has completed: producer is upstream of one of its regular bindings."""
+    stack = [b.source for b in task.fn_args + list(task.fn_kwargs.values()) if isinstance(b, Binding) and not b.stream]
+    seen = set()
+    while stack:
+        source = stack.pop()
+        if source is producer:
+            return True
+        if source in seen or source.completed:
             continue
-        task.ready = all(binding.source.completed for binding in flatten(task.fn_args + list(task.fn_kwargs.values())))
+        seen.add(source)
+        # a streaming consumer completes after its producer too, so follow every binding
+        stack.extend(b.source for b in source.fn_args + list(source.fn_kwargs.values()) if isinstance(b, Binding))
+    return False
+
+def input_channels(task):
+    """Channels of the streaming bindings a task consumes. Call before resolve_bindings."""
+    return [b.channel for b in task.fn_args + list(task.fn_kwargs.values()) if b.channel is not None]
 
-def make_runner(task):
-    """Makes a runner for a task."""
+def make_runner(task, on_chunk=None):
+    """
+    Makes a runner for a task.
+    
+    Chunked results are drained inside the worker: every chunk is pushed to
+    the subscribed channels and reported through on_chunk, and the runner
+    returns the joined output.
+    """
     def runner():
-        return task.fn(*task.fn_args, **task.fn_kwargs)
+        try:
+            result = task.fn(*task.fn_args, **task.fn_kwargs)
+            if not is_chunked(result):
+                for channel in task.subscribers:
+                    channel.put(result)
+            else:
+                chunks = []
+                for chunk in result:
+                    chunks.append(chunk)
+                    for channel in task.subscribers:
+                        channel.put(chunk)
+                    if on_chunk:
+                        on_chunk(task, chunk)
+                result = ''.join(chunks)
+        except BaseException as error:
+            for channel in task.subscribers:
+                channel.close(error)
+            raise
+        for channel in task.subscribers:
+            channel.close()
+        return result
     return runner
 
-def run_graph(tasks, max_workers=10):
+def lookup_cache(cache, task):
+    """
+    Looks a task with resolved bindings up in the cache.
+    
+    Returns (key, value); key is None when the task is not cacheable and value
+    is MISS unless it was found. On a hit the value is fed to the task's
+    streaming subscribers, as the runner would have done.
+    """
+    if cache is None or not task.cache:
+        return None, MISS
+    key = cache.key(task.fn, task.fn_args, task.fn_kwargs)
+    if key is None: # some input cannot be pickled, so it has no content address
+        return None, MISS
+    value = cache.get(key)
+    if value is not MISS:
+        publish(task, value)
+    return key, value
+
+def publish(task, value, error=None):
+    """Feeds a whole output (or the error) to the streaming subscribers of a task that did not run through make_runner."""
+    for channel in task.subscribers:
+        if error is None:
+            channel.put(value)
+        channel.close(error)
+
+def publish_result(task, future):
+    """Done callback publishing the result of a future to the task's streaming subscribers."""
+    error = future.exception()
+    publish(task, None if error else future.result(), error)
+
+def run_in_thread(fn):
+    """Runs fn on its own daemon thread and returns a Future for its result."""
+    future = Future()
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn())
+        except BaseException as error:
+            future.set_exception(error)
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+def run_graph(
+    tasks, max_workers=10, mode='thread', max_processes=None, executor=None,
+    cache=None, state=None, policy=None, history=None, tracer=None, resources=None,
+    checkpoint=None, resume=False, verbose=True,
+):
+    """
+    Runs the task graph, yielding (output, name) for yielder tasks and
+    (chunk, "name:chunk") for each chunk they stream.
+    
+    mode picks the GraphExecutor backend ('thread', 'process' or 'hybrid');
+    pass an executor to supply your own instead, it is left running. With a ResultCache, tasks
+    whose function and resolved inputs were seen before are not run at all.
+    
+    With a RunState, only the tasks that changed since the run recorded in it,
+    and their transitive dependents, are run; the other outputs are reused.
+    checkpoint is the path of a sqlite file that completed outputs are
+    committed to; with resume=True the tasks it already holds are skipped.
+    
+    Ready tasks wait in a queue ordered by policy (FifoPolicy by default) and
+    are submitted only while the executor has a free worker. Durations of
+    executed tasks are recorded into history, a DurationHistory, if given.
+    
+    Tasks declaring timeout or retries are retried with exponential backoff
+    when an attempt fails or runs too long. A task declaring hedge, say 95,
+    gets a duplicate attempt once it has run longer than that percentile of
+    its durations in history, and the first attempt to finish wins; see
+    submit_attempts. Share one history across runs so it has durations to go by.
+    
+    A RunTracer passed as tracer records per-task timings and workers.
+    
+    A task feeding streaming bindings is only submitted once all of its
+    streaming consumers have started: its chunks would otherwise fill their
+    channels, and it would hold a worker that the consumers' other sources
+    need, before anything reads them.
+    
+    With a ResourceManager as resources, a ready task is only submitted once
+    the named resources, rate limits and memory it declares are available.
+    
+    verbose=False skips the graph summary, which enumerates every path and
+    gets expensive on large or highly connected graphs.
+    """
     detect_circular_dependencies(tasks)
-    print('no circular dependency detected')
-    print_task_graph_summary(tasks)
+    if verbose:
+        print('no circular dependency detected')
+        print_task_graph_summary(tasks)
+    
+    state = open_state(state, checkpoint, resume)
+    keys, reused = reuse_previous_outputs(tasks, state) if state is not None else ({}, [])
+    dependents, indegree = build_dependency_graph(tasks)
+    policy = policy or FifoPolicy()
+    policy.prepare(tasks, dependents)
+    if resources is not None:
+        for task in indegree:
+            resources.check(task)
     
+    owns_executor = executor is None # otherwise the caller may run more graphs on it
+    if owns_executor:
+        executor = GraphExecutor(mode, max_workers=max_workers, max_processes=max_processes)
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    try:
         future_to_task = {}
+        cache_keys = {}
+        ready = ReadyQueue(policy, resources)
+        streams_from = {} # streaming consumer -> the producers it reads from
+        consumers = {} # producer -> its streaming consumers not started yet
+        for task in indegree:
+            if task.num_runs == 0 and not task.completed:
+                for binding in task.fn_args + list(task.fn_kwargs.values()):
+                    if binding.channel is not None and binding.channel.bounded:
+                        streams_from.setdefault(task, []).append(binding.source)
+                        consumers.setdefault(binding.source, set()).add(task)
+        held = set() # producers waiting for their consumers to start
+        running = {} # task -> submit time, for tasks holding an executor worker
+        events = queue.SimpleQueue() # filled by workers and done callbacks, drained by this thread
+        
+        def on_chunk(task, chunk):
+            events.put((task, chunk))
+        
+        def hedge_after(task):
+            if task.hedge is None or history is None:
+                return None
+            return history.percentile(task.name, task.hedge)
+        
+        def submit(task):
+            task.ready = True
+            channels = input_channels(task)
+            task.resolve_bindings()
+            runner = make_runner(task, on_chunk if task.yielder else None)
+            key, value = lookup_cache(None if channels else cache, task) # iterators have no content address
+            on_run = tracer.ran if tracer else None
+            if tracer:
+                tracer.submitted(task)
+            if value is not MISS:
+                new_future = Future()
+                new_future.set_result(value)
+            elif channels:
+                # A streaming consumer waits on its producers, so it gets its own
+                # thread: parked in the pool it could starve them of workers.
+                new_future = run_in_thread(timed(task, runner, on_run) if tracer else runner)
+                new_future.add_done_callback(lambda _: [c.abandon() for c in channels])
+                for producer in streams_from.pop(task, ()):
+                    consumers[producer].discard(task)
+                    if not consumers[producer] and producer in held:
+                        held.discard(producer)
+                        admit(producer)
+            elif isinstance(task, MapTask):
+                new_future = submit_attempts(task, partial(executor.map, task, task.fn_args[0], on_run), hedge_after(task))
+                new_future.add_done_callback(partial(publish_result, task))
+                running[task] = time.perf_counter()
+            else:
+                new_future = submit_attempts(task, partial(executor.submit, task, runner, on_run), hedge_after(task))
+                running[task] = time.perf_counter()
+            if value is MISS and key is not None:
+                cache_keys[task] = key
+            task.num_runs += 1
+            future_to_task[new_future] = task
+            new_future.add_done_callback(events.put)
+        
+        def make_ready(task):
+            if tracer:
+                tracer.ready(task)
+            if consumers.get(task):
+                held.add(task)
+            else:
+                admit(task)
+        
+        def admit(task):
+            if input_channels(task):
+                submit(task) # needs no worker, and must not queue behind its own producer
+            else:
+                ready.push(task)
+        
+        def dispatch():
+            while len(running) < executor.capacity:
+                task = ready.pop()
+                if task is None:
+                    return
+                submit(task)
         
-        def run_ready_tasks():
-            for task in filter(lambda t: t.ready and t.num_runs==0, tasks):
-                task.resolve_bindings()
-                runner = make_runner(task)
-                new_future = executor.submit(runner)
-                task.num_runs += 1
-                future_to_task[new_future] = task
-        
-        run_ready_tasks()
-        
-        while future_to_task:
-            for future in as_completed(future_to_task): # Wait for the next completed future
-                task = future_to_task.pop(future)
-                result = future.result()
-                
-                # Handle streaming results
-                if hasattr(result, '__iter__') and not isinstance(result, (str, bytes, dict)):
-                    # For iterable results (like generators)
-                    chunks = []
-                    for chunk in result:
-                        chunks.append(chunk)
-                        if task.yielder:
-                            yield chunk, f"{task.name}:chunk"
-                    task.output = ''.join(chunks)
-                else:
-                    # For non-iterable results
-                    task.output = result
-                
-                
-                task.completed = True
-                mark_tasks_whose_dependencies_are_satisfied_as_ready(tasks)
-                run_ready_tasks()
-                if task.yielder:
-                    yield task.output, task.name
+        for task in reused:
+            if task.yielder:
+                yield task.output, task.name
+        
+        for task in indegree:
+            if (task.ready or indegree[task] == 0) and task.num_runs == 0 and not task.completed:
+                make_ready(task)
+        dispatch()
+        
+        while future_to_task or ready or held:
+            if not future_to_task and not ready:
+                # the consumers left wait, through other streams, for their own
+                # producers to complete: let the producers buffer everything
+                for task in list(held):
+                    held.discard(task)
+                    for channel in task.subscribers:
+                        channel.unbound()
+                    admit(task)
+                dispatch()
+                continue
+            try:
+                event = events.get(timeout=ready.timeout()) # Wait for the next chunk or completed future
+            except queue.Empty: # a rate limit refilled
+                ready.wake()
+                dispatch()
+                continue
+            if not isinstance(event, Future):
+                task, chunk = event
+                yield chunk, f"{task.name}:chunk"
+                continue
+            task = future_to_task.pop(event)
+            task.output = load_output(event.result())
+            task.completed = True
+            ready.release(task)
+            if task in running:
+                duration = time.perf_counter() - running.pop(task)
+                if history is not None:
+                    history.record(task.name, duration)
+            if tracer:
+                tracer.completed(task, task.output_before_postprocess)
+            if task in cache_keys:
+                cache.set(cache_keys.pop(task), task.output_before_postprocess)
+            if state is not None:
+                state.record(task.name, keys[task], task.output_before_postprocess)
+            # Only the dependents of the finished task can become ready: O(out-degree)
+            for dependent in dependents[task]:
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0 and dependent.num_runs == 0:
+                    make_ready(dependent)
+            dispatch()
+            if task.yielder:
+                yield task.output, task.name
+    finally:
+        if owns_executor: # timed out and outhedged attempts may still be running, their results are not needed
+            executor.shutdown(wait=False)
+
+
+def is_async(task):
+    return inspect.iscoroutinefunction(task.fn) or inspect.isasyncgenfunction(task.fn)
+
+async def arun_graph(
+    tasks, max_workers=10, mode='thread', max_processes=None, executor=None,
+    cache=None, state=None, resources=None, checkpoint=None, resume=False, verbose=True,
+):
+    """
+    Async counterpart of run_graph, to be consumed with `async for`.
+    
+    Coroutine functions are awaited and async generators drained directly on
+    the event loop, so any number of them can be in flight at once, bounded
+    only by the ResourceManager if one is given. Sync functions fall back to
+    the executor. Both get their timeout and retries, but no hedging: an
+    attempt of a coroutine function that runs too long is cancelled. Streaming
+    bindings are resolved as regular bindings here.
+    """
+    detect_circular_dependencies(tasks)
+    if verbose:
+        print('no circular dependency detected')
+        print_task_graph_summary(tasks)
+    
+    state = open_state(state, checkpoint, resume)
+    keys, reused = reuse_previous_outputs(tasks, state) if state is not None else ({}, [])
+    dependents, indegree = build_dependency_graph(tasks, streaming=False)
+    if resources is not None:
+        for task in indegree:
+            resources.check(task)
+    
+    loop = asyncio.get_running_loop()
+    owns_executor = executor is None
+    if owns_executor:
+        executor = GraphExecutor(mode, max_workers=max_workers, max_processes=max_processes)
+    
+    future_to_task = {}
+    cache_keys = {}
+    ready = ReadyQueue(FifoPolicy(), resources)
+    events = asyncio.Queue()
+    
+    def on_chunk(task, chunk): # called from worker threads
+        loop.call_soon_threadsafe(events.put_nowait, (task, chunk))
+    
+    async def arunner(task):
+        result = task.fn(*task.fn_args, **task.fn_kwargs)
+        if not inspect.isasyncgen(result):
+            return await result
+        chunks = []
+        async for chunk in result:
+            chunks.append(chunk)
+            if task.yielder:
+                events.put_nowait((task, chunk))
+        return ''.join(chunks)
+    
+    async def attempts(task):
+        """arunner with the task's timeout and retries, backing off like submit_attempts."""
+        for failures in itertools.count():
+            try:
+                return await asyncio.wait_for(arunner(task), task.timeout)
+            except asyncio.TimeoutError:
+                error = TimeoutError(f"{task.name} did not finish within {task.timeout}s")
+            except Exception as exception:
+                error = exception
+            if failures >= task.retries:
+                raise error
+            await asyncio.sleep(task.backoff * 2 ** failures)
+    
+    def submit(task):
+        task.ready = True
+        task.resolve_bindings()
+        key, value = lookup_cache(cache, task)
+        if value is not MISS:
+            new_future = loop.create_future()
+            new_future.set_result(value)
+        elif isinstance(task, MapTask):
+            new_future = asyncio.wrap_future(submit_attempts(task, partial(executor.map, task, task.fn_args[0])))
+        elif is_async(task):
+            new_future = asyncio.ensure_future(attempts(task))
+        else:
+            runner = make_runner(task, on_chunk if task.yielder else None)
+            new_future = asyncio.wrap_future(submit_attempts(task, partial(executor.submit, task, runner)))
+        if value is MISS and key is not None:
+            cache_keys[task] = key
+        task.num_runs += 1
+        future_to_task[new_future] = task
+        new_future.add_done_callback(events.put_nowait)
+    
+    def dispatch():
+        while (task := ready.pop()) is not None:
+            submit(task)
+    
+    try:
+        for task in reused:
+            if task.yielder:
+                yield task.output, task.name
+        
+        for task in indegree:
+            if (task.ready or indegree[task] == 0) and task.num_runs == 0 and not task.completed:
+                ready.push(task)
+        dispatch()
+        
+        while future_to_task or ready:
+            try: # Wait for the next chunk or completed future
+                event = await asyncio.wait_for(events.get(), timeout=ready.timeout())
+            except asyncio.TimeoutError: # a rate limit refilled
+                ready.wake()
+                dispatch()
+                continue
+            if isinstance(event, tuple):
+                task, chunk = event
+                yield chunk, f"{task.name}:chunk"
+                continue
+            task = future_to_task.pop(event)
+            task.output = load_output(event.result())
+            task.completed = True
+            ready.release(task)
+            if task in cache_keys:
+                cache.set(cache_keys.pop(task), task.output_before_postprocess)
+            if state is not None:
+                state.record(task.name, keys[task], task.output_before_postprocess)
+            for dependent in dependents[task]:
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0 and dependent.num_runs == 0:
+                    ready.push(dependent)
+            dispatch()
+            if task.yielder:
+                yield task.output, task.name
+    finally:
+        if owns_executor:
+            executor.shutdown(wait=False) # never block the event loop
+
+
+
+
+
+
+
 
 
+##### TESTS #####
 
 
+import os
+import tempfile
+import unittest
+
+from cache import ResultCache
+from incremental import RunState
+from resources import ResourceManager, TokenBucket
+from task import Binding, MapTask, Task
+
+
+class TestRunGraph(unittest.TestCase):
+    
+    def run_to_end(self, tasks, **kwargs):
+        """Runs the graph and returns {name: output} of its yielder tasks."""
+        return {name: output for output, name in run_graph(tasks, verbose=False, **kwargs)}
+    
+    def test_diamond(self):
+        calls = []
+        def record(name, value):
+            calls.append(name)
+            return value
+        top = Task(lambda: record('top', 'x'), name='top', ready=True)
+        left = Task(lambda x: record('left', x + 'l'), name='left', fn_args=[Binding(top)])
+        right = Task(lambda x: record('right', x + 'r'), name='right', fn_args=[Binding(top)])
+        bottom = Task(lambda l, r: record('bottom', l + r), name='bottom', fn_args=[Binding(left), Binding(right)], yielder=True)
+        
+        outputs = self.run_to_end([top, left, right, bottom], max_workers=2)
+        
+        self.assertEqual(outputs, {'bottom': 'xlxr'})
+        self.assertEqual(sorted(calls), ['bottom', 'left', 'right', 'top'])
+        self.assertEqual(calls[0], 'top')
+        self.assertEqual(calls[-1], 'bottom')
+    
+    def test_duplicate_tasks_run_once(self):
+        calls = []
+        source = Task(lambda: calls.append('source') or 'x', name='source', ready=True)
+        # the same binding source twice, and the same task listed twice
+        sink = Task(lambda a, b: a + b, name='sink', fn_args=[Binding(source), Binding(source)], yielder=True)
+        
+        outputs = self.run_to_end([source, sink, source, sink], max_workers=1)
+        
+        self.assertEqual(outputs, {'sink': 'xx'})
+        self.assertEqual(calls, ['source'])
+        self.assertEqual((source.num_runs, sink.num_runs), (1, 1))
+    
+    def test_unlisted_source_is_run(self):
+        source = Task(lambda: 'x', name='source', ready=True)
+        sink = Task(lambda x: x * 2, name='sink', fn_args=[Binding(source)], yielder=True)
+        
+        self.assertEqual(self.run_to_end([sink]), {'sink': 'xx'})
+    
+    def test_task_exception_propagates(self):
+        def fail():
+            raise KeyError('boom')
+        failing = Task(fail, name='failing', ready=True)
+        downstream = Task(lambda x: x, name='downstream', fn_args=[Binding(failing)], yielder=True)
+        
+        with self.assertRaises(KeyError):
+            self.run_to_end([failing, downstream])
+        self.assertEqual(downstream.num_runs, 0)
+    
+    def test_cache_tells_bound_methods_apart(self):
+        class Greeter:
+            def __init__(self, name):
+                self.name = name
+            def greet(self):
+                return f'hi {self.name}'
+        cache = ResultCache()
+        
+        for name in ('a', 'b'):
+            greet = Task(Greeter(name).greet, name='greet', ready=True, yielder=True)
+            self.assertEqual(self.run_to_end([greet], cache=cache), {'greet': f'hi {name}'})
+    
+    def test_cache_skips_unpicklable_inputs(self):
+        class Doc: # local, so it cannot be pickled
+            def __init__(self, text):
+                self.text = text
+        cache = ResultCache()
+        
+        for text in ('alpha', 'beta', 'gamma'):
+            load = Task(lambda text=text: Doc(text), name='load', ready=True)
+            shout = Task(lambda doc: doc.text.upper(), name='shout', fn_args=[Binding(load)], yielder=True)
+            self.assertEqual(self.run_to_end([load, shout], cache=cache), {'shout': text.upper()})
+        self.assertIsNone(cache.key(str.upper, [Doc('alpha')], {}))
+        self.assertEqual(cache.hits, 0)
+    
+    def build_incremental_graph(self, calls, a_value, handle=None):
+        def record(name, value):
+            calls.append(name)
+            return value
+        a = Task(lambda v=a_value: record('a', v), name='a', ready=True)
+        b = Task(lambda: record('b', 'b'), name='b', ready=True)
+        c = Task(lambda x: record('c', x + 'c'), name='c', fn_args=[Binding(a)])
+        d = Task(lambda x, h=handle: record('d', x + 'd'), name='d', fn_args=[Binding(b)])
+        e = Task(lambda x, y: record('e', x + y), name='e', fn_args=[Binding(c), Binding(d)], yielder=True)
+        return [a, b, c, d, e]
+    
+    def test_run_state_reruns_only_changed_tasks(self):
+        state = RunState()
+        calls = []
+        self.assertEqual(self.run_to_end(self.build_incremental_graph(calls, 'a'), state=state), {'e': 'acbd'})
+        self.assertEqual(sorted(calls), ['a', 'b', 'c', 'd', 'e'])
+        
+        calls.clear()
+        self.assertEqual(self.run_to_end(self.build_incremental_graph(calls, 'A'), state=state), {'e': 'Acbd'})
+        self.assertEqual(sorted(calls), ['a', 'c', 'e'])
+        
+        calls.clear()
+        self.assertEqual(self.run_to_end(self.build_incremental_graph(calls, 'A'), state=state), {'e': 'Acbd'})
+        self.assertEqual(calls, [])
+    
+    def test_run_state_reruns_unpicklable_tasks(self):
+        state = RunState()
+        calls = []
+        handle = threading.Lock() # cannot be pickled, so d has no key
+        self.run_to_end(self.build_incremental_graph(calls, 'a', handle), state=state)
+        calls.clear()
+        
+        self.assertEqual(self.run_to_end(self.build_incremental_graph(calls, 'a', handle), state=state), {'e': 'acbd'})
+        self.assertEqual(sorted(calls), ['d', 'e'])
+    
+    def test_transform_runs_once_per_source(self):
+        calls = []
+        def shout(x):
+            calls.append(x)
+            return x.upper()
+        source = Task(lambda: 'hey', name='source', ready=True, postprocess=lambda x: calls.append('post') or x)
+        sinks = [Task(lambda x: x, name=f'sink{i}', fn_args=[Binding(source, shout)], yielder=True) for i in range(5)]
+        plain = Task(lambda x: x, name='plain', fn_args=[Binding(source)], yielder=True)
+        
+        outputs = self.run_to_end([source, *sinks, plain])
+        
+        self.assertEqual(outputs, {**{f'sink{i}': 'HEY' for i in range(5)}, 'plain': 'hey'})
+        self.assertEqual(calls, ['post', 'hey'])
+    
+    def concurrency_probe(self):
+        """A task body recording when it ran, and the peak number of copies running at once."""
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0, 'starts': []}
+        def body(seconds=0.05):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+                state['starts'].append(time.perf_counter())
+            time.sleep(seconds)
+            with lock:
+                state['running'] -= 1
+        return body, state
+    
+    def test_resource_limits(self):
+        body, state = self.concurrency_probe()
+        free_body, free_state = self.concurrency_probe()
+        limited = [Task(body, name=f'llm{i}', ready=True, resources={'llm': 1}) for i in range(6)]
+        free = [Task(free_body, name=f'free{i}', ready=True) for i in range(4)]
+        
+        self.run_to_end([*limited, *free], max_workers=10, resources=ResourceManager(limits={'llm': 2}))
+        
+        self.assertEqual(state['peak'], 2)
+        self.assertEqual(len(state['starts']), 6)
+        self.assertEqual(free_state['peak'], 4) # not held up behind the limited tasks
+    
+    def test_rate_limits(self):
+        body, state = self.concurrency_probe()
+        tasks = [Task(partial(body, 0), name=f'call{i}', ready=True, resources={'api': 1}) for i in range(4)]
+        
+        self.run_to_end(tasks, max_workers=4, resources=ResourceManager(rate_limits={'api': TokenBucket(rate=10)}))
+        
+        gaps = [b - a for a, b in zip(state['starts'], state['starts'][1:])]
+        self.assertEqual(len(gaps), 3)
+        self.assertTrue(all(gap > 0.08 for gap in gaps), gaps)
+    
+    def test_memory_limit(self):
+        for memory, peak in ((60, 1), (40, 2)):
+            body, state = self.concurrency_probe()
+            tasks = [Task(body, name=f'big{i}', ready=True, memory=memory) for i in range(4)]
+            
+            self.run_to_end(tasks, max_workers=4, resources=ResourceManager(memory_limit=100))
+            
+            self.assertEqual(state['peak'], peak)
+    
+    def test_impossible_requirements(self):
+        resources = ResourceManager(limits={'llm': 2}, memory_limit=100)
+        for task in (Task(abs, name='greedy', ready=True, resources={'llm': 3}), Task(abs, name='huge', ready=True, memory=101)):
+            with self.assertRaises(ValueError):
+                self.run_to_end([task], resources=resources)
+            self.assertEqual(task.num_runs, 0)
+    
+    def test_resume_from_checkpoint(self):
+        calls = []
+        def build(fail):
+            def record(name, value):
+                calls.append(name)
+                return value
+            def last(x, y):
+                if fail:
+                    raise RuntimeError('crash')
+                return record('last', x + y)
+            a = Task(lambda: record('a', 'a'), name='a', ready=True)
+            b = Task(lambda: record('b', 'b'), name='b', ready=True)
+            return [a, b, Task(last, name='last', fn_args=[Binding(a), Binding(b)], yielder=True)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.sqlite')
+            with self.assertRaises(RuntimeError):
+                self.run_to_end(build(fail=True), checkpoint=path)
+            self.assertEqual(sorted(calls), ['a', 'b'])
+            
+            calls.clear()
+            self.assertEqual(self.run_to_end(build(fail=False), checkpoint=path, resume=True), {'last': 'ab'})
+            self.assertEqual(calls, ['last'])
+            
+            calls.clear()
+            self.run_to_end(build(fail=False), checkpoint=path) # without resume, start over
+            self.assertEqual(sorted(calls), ['a', 'b', 'last'])
+    
+    def test_map_task(self):
+        source = Task(lambda: [1, 2, 3, 4, 5], name='source', ready=True)
+        squares = MapTask(lambda x: x * x, Binding(source), batch_size=2, name='squares', yielder=True)
+        
+        self.assertEqual(self.run_to_end([source, squares]), {'squares': [1, 4, 9, 16, 25]})
+    
+    def test_map_task_rejects_streaming_source(self):
+        source = Task(lambda: iter([1, 2]), name='source', ready=True)
+        with self.assertRaises(ValueError):
+            MapTask(lambda x: x, Binding(source, stream=True))
+    
+    def test_async_task_timeout_and_retries(self):
+        attempts = []
+        async def flaky():
+            attempts.append(None)
+            if len(attempts) < 3:
+                await asyncio.sleep(10)
+            return 'done'
+        task = Task(flaky, name='flaky', ready=True, yielder=True, timeout=0.05, retries=2, backoff=0)
+        
+        async def run():
+            return [output async for output, _ in arun_graph([task], verbose=False)]
+        
+        self.assertEqual(asyncio.run(run()), ['done'])
+        self.assertEqual(len(attempts), 3)
+    
+    def test_streaming_consumer_with_regular_source(self):
+        # The producer outgrows its channel: submitted first, it would block on
+        # the only worker, and the consumer's other source would never run.
+        producer = Task(lambda: iter(['a', 'b', 'c', 'd', 'e']), name='producer', ready=True)
+        other = Task(lambda: '!', name='other', ready=True)
+        consumer = Task(
+            lambda chunks, suffix: ''.join(chunks) + suffix,
+            name='consumer',
+            fn_args=[Binding(producer, stream=True, buffer_size=2), Binding(other)],
+            yielder=True,
+        )
+        
+        outputs = run_in_thread(lambda: self.run_to_end([producer, other, consumer], max_workers=1))
+        
+        self.assertEqual(outputs.result(timeout=10), {'consumer': 'abcde!'})
+    
+    def test_streaming_consumer_of_its_own_producer(self):
+        # more chunks than the channel holds, read only once the producer is done
+        chunks = [str(i % 10) for i in range(40)]
+        producer = Task(lambda: iter(chunks), name='producer', ready=True)
+        upper = Task(lambda x: x.upper(), name='upper', fn_args=[Binding(producer)])
+        direct = Task(
+            lambda chunks, whole: f'{"".join(chunks)}/{whole}',
+            name='direct',
+            fn_args=[Binding(producer, stream=True, buffer_size=4), Binding(producer)],
+            yielder=True,
+        )
+        indirect = Task(
+            lambda chunks, whole: f'{"".join(chunks)}/{whole}',
+            name='indirect',
+            fn_args=[Binding(producer, stream=True, buffer_size=4), Binding(upper)],
+            yielder=True,
+        )
+        
+        outputs = run_in_thread(lambda: self.run_to_end([producer, upper, direct, indirect], max_workers=1))
+        
+        whole = ''.join(chunks)
+        self.assertEqual(outputs.result(timeout=10), {'direct': f'{whole}/{whole}', 'indirect': f'{whole}/{whole}'})
+
 
+if __name__ == '__main__':
+    unittest.main()
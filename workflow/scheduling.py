@@ -0,0 +1,137 @@
+from collections import deque
+from itertools import count
+import heapq
+import statistics
+
+
+class DurationHistory:
+    """Recent run durations of tasks, by task name."""
+    def __init__(self, window=50, default=1.0):
+        self.window = window
+        self.default = default # estimate for tasks never seen before
+        self.durations = {}
+    
+    def record(self, name, duration):
+        self.durations.setdefault(name, deque(maxlen=self.window)).append(duration)
+    
+    def estimate(self, name):
+        """Median of the recent durations of a task."""
+        if name not in self.durations:
+            return self.default
+        return statistics.median(self.durations[name])
+    
+    def percentile(self, name, q):
+        """q-th percentile (0-100) of the recent durations of a task, None if unknown."""
+        samples = sorted(self.durations.get(name, ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+
+class FifoPolicy:
+    """Ready tasks are submitted in the order they became ready."""
+    def prepare(self, tasks, dependents):
+        pass
+    
+    def priority(self, task):
+        """Sort key of a ready task, lowest runs first; ties stay FIFO."""
+        return 0
+
+
+class PriorityPolicy(FifoPolicy):
+    """Ready tasks with a higher Task.priority are submitted first."""
+    def priority(self, task):
+        return -task.priority
+
+
+class CriticalPathPolicy(FifoPolicy):
+    """
+    Ready tasks with the longest remaining path to a sink are submitted first.
+    
+    A path is weighted by the durations recorded in history, so the chains
+    that bound the makespan get workers before cheap leaf tasks do.
+    """
+    def __init__(self, history=None):
+        self.history = history or DurationHistory()
+        self.remaining = {}
+    
+    def prepare(self, tasks, dependents):
+        # topological order over the dependent edges, then ranks from the sinks up
+        indegree = {task: 0 for task in dependents}
+        for task in dependents:
+            for dependent in dependents[task]:
+                indegree[dependent] = indegree.get(dependent, 0) + 1
+        order = [task for task, degree in indegree.items() if degree == 0]
+        for task in order: # order grows while iterating
+            for dependent in dependents.get(task, ()):
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    order.append(dependent)
+        for task in reversed(order):
+            downstream = max((self.remaining[d] for d in dependents.get(task, ())), default=0)
+            self.remaining[task] = self.history.estimate(task.name) + downstream
+    
+    def priority(self, task):
+        return -self.remaining.get(task, 0)
+
+
+class ReadyQueue:
+    """
+    Ready tasks waiting to be submitted, in policy order.
+    
+    With a ResourceManager, a task that cannot be admitted is parked on
+    whatever blocks it and only goes back in line when that is released (or
+    when its rate limit refills), so blocked tasks are not rescanned on every
+    completion and tasks behind them in line are not held up.
+    """
+    def __init__(self, policy, resources=None):
+        self.policy = policy
+        self.resources = resources
+        self.heap = [] # (policy priority, arrival order, task)
+        self.arrival = count()
+        self.parked = {} # blocker -> heap entries
+        self.admitted = set() # popped tasks holding resources
+    
+    def __len__(self):
+        return len(self.heap) + sum(len(entries) for entries in self.parked.values())
+    
+    def push(self, task):
+        heapq.heappush(self.heap, (self.policy.priority(task), next(self.arrival), task))
+    
+    def pop(self):
+        """Next task that can be admitted, with its resources acquired; None if there is none."""
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            task = entry[2]
+            if self.resources is None:
+                return task
+            blocker = self.resources.blocker(task)
+            if blocker is None:
+                self.resources.acquire(task)
+                self.admitted.add(task)
+                return task
+            self.parked.setdefault(blocker, []).append(entry)
+        return None
+    
+    def _unpark(self, blocker):
+        for entry in self.parked.pop(blocker, ()):
+            heapq.heappush(self.heap, entry)
+    
+    def release(self, task):
+        """A task finished: give back its resources and requeue what waited on them."""
+        if task not in self.admitted:
+            return
+        self.admitted.remove(task)
+        for blocker in self.resources.release(task):
+            self._unpark(blocker)
+    
+    def timeout(self):
+        """Seconds until a rate-limited task may be admitted, None if none is waiting."""
+        waits = [self.resources.wait_time(b) for b in self.parked if isinstance(b, tuple)]
+        return min(waits, default=None)
+    
+    def wake(self):
+        """Requeues the rate-limited tasks whose bucket has refilled."""
+        for blocker in [b for b in self.parked if isinstance(b, tuple)]:
+            if self.resources.wait_time(blocker) == 0:
+                self._unpark(blocker)
@@ -0,0 +1,57 @@
+import queue
+
+
+_END = object()
+
+
+class Channel:
+    """
+    Bounded queue carrying the chunks of one producer Task to one subscriber.
+    
+    put() blocks while the buffer is full, so a fast producer is throttled to
+    the pace of its slowest subscriber instead of buffering without limit.
+    maxsize=0 makes it unbounded, for a subscriber that only starts reading
+    once the producer is done.
+    """
+    def __init__(self, maxsize=16):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self.abandoned = False
+    
+    @property
+    def bounded(self):
+        return self._queue.maxsize > 0
+    
+    def unbound(self):
+        """Lifts the limit, unblocking a producer waiting on a full buffer."""
+        with self._queue.mutex:
+            self._queue.maxsize = 0
+            self._queue.not_full.notify_all()
+    
+    def put(self, chunk):
+        if self.abandoned: # nobody is reading anymore, drop instead of blocking forever
+            return
+        self._queue.put(chunk)
+    
+    def close(self, error=None):
+        """Ends the stream. If error is given, the subscriber re-raises it."""
+        self._error = error
+        self.put(_END)
+    
+    def abandon(self):
+        """Called by the subscriber when it stops reading; unblocks the producer."""
+        self.abandoned = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+    
+    def __iter__(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is _END:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield chunk
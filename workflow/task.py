@@ -1,4 +1,5 @@
 from collections.abc import Callable
+from stream import Channel
 
 
 # transformer functions
@@ -7,13 +8,33 @@ def make_picker(k): return lambda x: x[k]
 def make_merger(): return lambda *x: '\n\n'.join(x)
 
 
+_UNSET = object()
+
+
     
 class Binding:
-    def __init__(self, source, transformer=make_identity()):
+    """
+    Connects an argument of a task to the output of a source task.
+    
+    With stream=True the argument is an iterator over the source's chunks, fed
+    through a bounded Channel while the source is still running, and the
+    transformer is applied to every chunk instead of to the whole output.
+    """
+    def __init__(self, source, transformer=make_identity(), stream=False, buffer_size=16):
         self.source = source
         self.transformer = transformer
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.channel = None
+    def subscribe(self, bounded=True):
+        """Opens a channel that the source's runner pushes each chunk into."""
+        self.channel = Channel(self.buffer_size if bounded else 0)
+        self.source.subscribers.append(self.channel)
+        return self.channel
     def resolve(self):
-        return self.transformer(self.source.output)
+        if self.channel is not None:
+            return map(self.transformer, self.channel)
+        return self.source.transformed(self.transformer)
 
 
 class Task:
@@ -26,6 +47,15 @@ class Task:
         postprocess: Callable = make_identity(), 
         ready: bool = False, 
         yielder: bool = False,
+        cpu_bound: bool = False,
+        cache: bool = True,
+        priority: int = 0,
+        resources: dict[str, int] = None,
+        memory: int = 0,
+        timeout: float = None,
+        retries: int = 0,
+        backoff: float = 0.5,
+        hedge: float = None,
         
         # state variables
         completed=False,
@@ -38,10 +68,22 @@ class Task:
         self.postprocess = postprocess
         self.ready = ready
         self.yielder = yielder
+        self.cpu_bound = cpu_bound
+        self.cache = cache # set False to opt out of run_graph(cache=...)
+        self.priority = priority # used by PriorityPolicy, higher runs first
+        self.resources = resources or {} # e.g. {'llm': 1}, admitted by run_graph(resources=...)
+        self.memory = memory # estimated bytes, admitted against ResourceManager.memory_limit
+        self.timeout = timeout # seconds an attempt may take before it counts as failed
+        self.retries = retries # extra attempts after a failure or timeout
+        self.backoff = backoff # seconds before the first retry, doubled for each next one
+        self.hedge = hedge # percentile of past durations after which a duplicate attempt starts, e.g. 95
         
         # state variables
         self.completed = completed
         self.num_runs = num_runs
+        self.subscribers = [] # channels of downstream streaming bindings
+        self._output = _UNSET # postprocessed output, computed once
+        self._transformed = {} # transformer -> transformed output, shared by bindings
         
     @property
     def name(self):
@@ -55,11 +97,21 @@ class Task:
         
     @property
     def output(self):
-        return self.postprocess(self.output_before_postprocess)
+        if self._output is _UNSET:
+            self._output = self.postprocess(self.output_before_postprocess)
+        return self._output
     
     @output.setter
     def output(self, value):
         self.output_before_postprocess = value
+        self._output = _UNSET
+        self._transformed = {}
+    
+    def transformed(self, transformer):
+        """Output passed through transformer, computed once however many bindings share the transformer."""
+        if transformer not in self._transformed:
+            self._transformed[transformer] = transformer(self.output)
+        return self._transformed[transformer]
         
     def resolve_bindings(self):
         """Resolves bindings in a task."""
@@ -68,4 +120,27 @@ class Task:
         return self
     
     def __str__(self):
-        return f'{self.name} - {self.fn.__name__}()'
\ No newline at end of file
+        return f'{self.name} - {self.fn.__name__}()'
+
+
+class MapTask(Task):
+    """
+    Applies fn to every item of the iterable its source binding resolves to.
+    
+    Items are sent to the executor batch_size at a time, so a data-parallel
+    stage over thousands of small items costs one task in the graph and one
+    submission per batch instead of one Task per item. The output is the list
+    of results, in input order. The source binding cannot stream: the items
+    are all needed up front to be batched.
+    """
+    def __init__(self, fn: Callable, source: Binding, batch_size: int = 64, **kwargs):
+        if source.stream:
+            raise ValueError(f"MapTask {kwargs.get('name') or fn.__name__!r} cannot map over a streaming binding, bind to the whole output instead")
+        super().__init__(fn, fn_args=[source], **kwargs)
+        self.batch_size = batch_size
+    
+    def resolve_bindings(self):
+        """Resolves the source binding into a list, so it can be sliced into batches."""
+        super().resolve_bindings()
+        self.fn_args = [list(self.fn_args[0])]
+        return self